@@ -0,0 +1,99 @@
+"""
+Vectorized portfolio accounting over a whole step schedule.
+
+The steps of a run (start_idx/end_idx) only depend on the step size and the rows of the
+run, so they are known before the run starts. AccountingEngine finds the start and end
+row of every step and the price ratio (end price / start price) of every ticker in every
+step once. Given a weight matrix with one row per step (positive weights are buys and
+negative weights are shorts, as fractions of the portfolio value at the start of the
+step) it then finds the equity curve, the profit and loss of each step and the turnover
+with array operations instead of adding up the returns of each trade step by step.
+
+Transaction costs and slippage are models that take the matrix of traded fractions and
+return the cost of each step as a fraction of the portfolio value, so they are vectorized
+too. LinearCost covers commissions and half spreads and SquareRootImpact is a market
+impact model that grows faster than the size of the trade.
+"""
+
+import numpy as np
+
+
+def step_schedule(start_row, end_row, step_size):
+    """Start and end rows of every step of a run from start_row to end_row (inclusive)"""
+    starts = np.arange(start_row, end_row + 1, step_size + 1)  # Each step starts the row after the previous one
+    ends = np.minimum(starts + step_size, end_row)
+    return starts, ends
+
+
+class LinearCost:
+    def __init__(self, rate):
+        """rate is the cost per dollar traded (0.0005 is 5 basis points). It can be one number or an
+        array with a rate for each ticker column, such as half the bid-ask spread of each ticker."""
+        self.rate = rate
+
+    def __call__(self, trades):
+        """Cost of each step as a fraction of the portfolio value"""
+        return (trades * self.rate).sum(axis=1)
+
+
+class SquareRootImpact:
+    def __init__(self, coefficient):
+        """Market impact that moves the price by coefficient * sqrt(traded fraction), so the cost of a trade
+        is coefficient * traded fraction ** 1.5. The coefficient includes the size of the portfolio
+        relative to the volume of the tickers."""
+        self.coefficient = coefficient
+
+    def __call__(self, trades):
+        """Cost of each step as a fraction of the portfolio value"""
+        return self.coefficient * (trades ** 1.5).sum(axis=1)
+
+
+class AccountingEngine:
+    def __init__(self, prices, starts, ends):
+        """prices is the price matrix (trading days as rows and tickers as columns) and starts and ends are the
+        rows of each step from step_schedule"""
+        self.starts = starts
+        self.ends = ends
+        # Price ratio of every ticker over every step (NaN where a price is missing)
+        self.ratios = np.asarray(prices[ends], dtype=np.float64) / np.asarray(prices[starts], dtype=np.float64)
+
+    def step_gains(self, weights):
+        """Return of the portfolio in each step as a fraction of its value at the start of the step"""
+        # Tickers without a position are skipped so their missing prices do not turn the sum into NaN
+        return np.where(weights != 0, weights * (self.ratios - 1), 0.0).sum(axis=1)
+
+    def trades(self, weights, gains):
+        """Fraction of the portfolio traded in each ticker at the start of each step. The positions of the
+        previous step have drifted with its prices, so only the difference to the new weights is traded."""
+        drifted = np.where(weights != 0, weights * self.ratios, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drifted /= (1 + gains)[:, None]
+        previous = np.concatenate((np.zeros((1, weights.shape[1])), drifted[:-1]))
+        return np.abs(weights - previous)
+
+    def run(self, weights, amount, costs=()):
+        """Equity curve of a weight matrix with one row per step starting from amount. The first step has no
+        trades so its row should be zeros. costs is a list of cost models (such as LinearCost) that are
+        charged at the start of each step. Returns a dictionary of arrays with one entry per step:
+        values (portfolio value at the end of the step), pnl, gains, turnover and costs (in dollars).
+        The arrays stop at the first step that leaves the portfolio value at zero or below."""
+        gains = self.step_gains(weights)
+        trades = self.trades(weights, gains)
+        cost_fractions = np.zeros(len(gains))
+        for model in costs:
+            cost_fractions += model(trades)
+        values = amount * np.cumprod(1 + gains - cost_fractions)
+
+        # Stops at the first step where the portfolio is worth nothing like the step by step loop
+        busted = np.flatnonzero(values <= 0)
+        if len(busted):
+            values = values[:busted[0] + 1]
+        steps = len(values)
+        previous_values = np.concatenate(([amount], values[:-1]))
+        return {
+            'values': values,
+            'pnl': values - previous_values,
+            'gains': gains[:steps],
+            'turnover': trades[:steps].sum(axis=1),
+            'costs': cost_fractions[:steps] * previous_values
+        }
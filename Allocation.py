@@ -0,0 +1,68 @@
+"""
+Array based fund allocation for the backtester.
+
+The tickers with the largest indicator magnitudes are picked with a partial selection
+(np.partition) over the indicator vector instead of pushing every ticker onto a heap,
+which is O(n) instead of O(n log n) in Python. Funds are then split between the picked
+tickers proportionally to their indicator magnitudes like the heap based allocation did:
+a positive indicator is a buy and a negative indicator is a short.
+
+The weights returned are fractions of the portfolio value with one entry per ticker
+(column of the price matrix), so they can be used directly in array calculations.
+"""
+
+import numpy as np
+
+# Which ticker wins a tie at the cutoff: the first or the last column
+TIE_BREAKS = ('first', 'last')
+
+
+def num_positions(num_tickers, fraction=0.1, max_positions=None):
+    """Number of tickers to trade: the top fraction of the universe (at least one), capped at max_positions"""
+    # The small epsilon stops products like 0.1 * 70 from rounding down to the integer below
+    count = max(1, int(np.floor(num_tickers * fraction + 1e-9)))
+    if max_positions is not None:
+        count = min(count, max_positions)
+    return min(count, num_tickers)
+
+
+def select_top(indicators, count, tie_break='first'):
+    """Indices of the count indicators with the largest magnitude, ordered by decreasing magnitude.
+    Ties at the cutoff go to the ticker with the lower column index ('first', which matches the
+    heap ordering by ticker name for the sorted yfinance columns) or the higher one ('last').
+    NaN indicators are never picked before real ones."""
+    if tie_break not in TIE_BREAKS:
+        raise ValueError(f"Invalid tie_break: {tie_break}")
+    magnitudes = np.abs(indicators)
+    magnitudes = np.where(np.isnan(magnitudes), -np.inf, magnitudes)
+    if count < len(magnitudes):
+        # Value of the count-th largest magnitude found with a partial sort
+        threshold = np.partition(magnitudes, len(magnitudes) - count)[len(magnitudes) - count]
+        above = np.flatnonzero(magnitudes > threshold)
+        ties = np.flatnonzero(magnitudes == threshold)
+        if tie_break == 'last':
+            ties = ties[::-1]
+        selected = np.concatenate((above, ties[:count - len(above)]))
+    else:
+        selected = np.arange(len(magnitudes))
+    # Stable sort so equal magnitudes keep the tie breaking order
+    return selected[np.argsort(-magnitudes[selected], kind='stable')]
+
+
+def allocate_weights(indicators, fraction=0.1, max_positions=None, tie_break='first'):
+    """Returns buy and short weight vectors (fractions of the portfolio) and the selected indices"""
+    indicators = np.asarray(indicators, dtype=np.float64)
+    selected = select_top(indicators, num_positions(len(indicators), fraction, max_positions), tie_break)
+    buy_weights = np.zeros(len(indicators))
+    short_weights = np.zeros(len(indicators))
+    magnitudes = np.abs(indicators[selected])
+    total_magnitude = magnitudes.sum()
+    if not total_magnitude > 0:
+        return buy_weights, short_weights, selected[:0]  # Nothing to trade if every indicator is zero
+
+    # Proportion of the total value of the portfolio to put towards each trade
+    proportions = magnitudes / total_magnitude
+    buys = indicators[selected] > 0
+    buy_weights[selected[buys]] = proportions[buys]
+    short_weights[selected[~buys]] = proportions[~buys]
+    return buy_weights, short_weights, selected
@@ -2,17 +2,20 @@
 This class contains the backtester methods for the four strategies:
 1. Linear Regression
 2. Mean Reversion
-3. Median Reversion with Binary Search Tree
+3. Median Reversion with a rolling two heap median
 4. Combined Short and long term analysis strategy with mean reversion and linear regression
 
-Each strategy generates a dictionary with keys/stocks and values/indicators.
+Each strategy generates an array of indicators with one value per stock.
+The strategies are registered in Strategies.py and run by name.
 The backtester buys and sells stocks based on the indicators that each trading
 strategy generates. The larger the magnitude of the indicator the more funds
 that are allocated to buying or selling the stock. Positive indicator indicates
 a recommended buy and negative indicates a recommended sell. The backtester
-calculates the returns of the trades over many time steps and plots the results.
+calculates the returns of the trades over many time steps and returns them as a
+BacktestResults object (Results.py) that can be printed, plotted or exported.
 All strategies use the real price data to generate indicators and the returns are
-calculated from the actual price movements of the stocks. Data is from yfinance.
+calculated from the actual price movements of the stocks. Data is from yfinance
+by default or from any other data source in DataSources.py (such as the on-disk PriceCache).
 
 These strategies can be run and the parameters can be modified in the files:
 LinearRegression.py
@@ -21,226 +24,409 @@ MedianReversion.py
 ShortLongTerm.py
 """
 
-import yfinance as yf
+import time
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 import numpy as np
-import matplotlib.pyplot as plt
-import heapq
-from BST import BST
+from RollingMedian import RollingMedian
+from Accounting import AccountingEngine, step_schedule
+from Allocation import TIE_BREAKS, allocate_weights
+import Indicators
+from DataSources import YFinanceSource, add_missing
+from PriceStore import PriceStore
+from Profiling import RunProfiler
+from Results import BacktestResults, print_trades
+from StepLoop import finish_results, report_step, start_results, trade_step, weights_to_orders
+from Strategies import COMBINED_LOOKBACK, get_strategy
 
 
 class Backtester:
-    def __init__(self, tickers, start_date, end_date, amount):
-        self.tickers = tickers  # Stock symbols
+    def __init__(self, tickers, start_date, end_date, amount, data_source=None, data=None, verbosity=2,
+                 selection_fraction=0.1, max_positions=None, tie_break='first', storage='dense', memmap_dir=None,
+                 indicator_store=None):
+        self.tickers = list(dict.fromkeys(tickers))  # Stock symbols without duplicates
+        self.failures = {}  # Tickers whose prices could not be loaded and the reason
+        # 0 prints nothing, 1 prints the data and a summary of each run, 2 also prints every trade
+        self.verbosity = verbosity
+        # Fraction of the tickers traded each step, optional cap on the number of trades and which
+        # ticker wins a tie at the cutoff ('first' or 'last' column)
+        self.selection_fraction = selection_fraction
+        if max_positions is not None and max_positions < 1:
+            raise ValueError(f"Invalid max_positions: {max_positions}")
+        self.max_positions = max_positions
+        if tie_break not in TIE_BREAKS:
+            raise ValueError(f"Invalid tie_break: {tie_break}")
+        self.tie_break = tie_break
+        # 'dense' keeps the prices as float64. 'compact' keeps them as float32 with a validity bitmap,
+        # memory-mapped from a file in memmap_dir if it is given (see PriceStore.py)
+        if storage not in ('dense', 'compact'):
+            raise ValueError(f"Invalid storage: {storage}")
+        self.storage = storage
+        self.memmap_dir = memmap_dir
+        # Optional IndicatorStore (IndicatorStore.py) that keeps computed indicators for later runs
+        self.indicator_store = indicator_store
         self.start_date = pd.to_datetime(start_date)
         self.end_date = pd.to_datetime(end_date)
         self.amount = amount  # Starting money
-        self.data = self.get_stock_data()  # Gets price data
+        self.data_source = data_source if data_source is not None else YFinanceSource()
+        # Gets price data unless an already loaded price frame is passed in
+        self.data = data if data is not None else self.get_stock_data()
+        self.prepare_data()
         self.portfolio_value = self.amount
-        # Dictionaries to store indicators for each strategy
-        self.previous_slopes = {}
-        self.previous_mean_deviations = {}
-        self.previous_median_deviations = {}
-        self.previous_combined_indicators = {}
 
     def get_stock_data(self):
-        """Gets data for the specified tickers in the date range from yfinance"""
-        data = yf.download(self.tickers, start=self.start_date, end=self.end_date)
-        print(data['Close'].dropna(how='all'))  # prints a sample of the data
-        return data['Close'].dropna(how='all')  # drops null data
-
-    def run_strategy(self, step_size, strategy):
-        """Executes the specified trading strategy over defined period."""
+        """Gets data for the specified tickers in the date range from the data source (yfinance by default)"""
+        data, failures = self.data_source.fetch(self.tickers, self.start_date, self.end_date)
+        # Tickers that failed or came back without prices are reported instead of stopping the run
+        self.failures = add_missing(self.tickers, data, failures)
+        if self.verbosity >= 1:
+            print(data.dropna(how='all'))  # prints a sample of the data
+            if self.failures:
+                print(f"Could not load {len(self.failures)} of {len(self.tickers)} tickers:")
+                for ticker, reason in self.failures.items():
+                    print(f"  {ticker}: {reason}")
+        return data.dropna(how='all')  # drops null data
+
+    def prepare_data(self):
+        """Builds the positional lookups used instead of label based .loc slicing on self.data"""
+        # Contiguous price array with trading days as rows and tickers as columns
+        self.store = PriceStore.from_frame(self.data, self.storage == 'compact', self.memmap_dir)
+        self.prices = self.store.values
+        if self.store.compact:
+            # The frame shares the compact prices so the float64 frame can be freed
+            self.data = self.store.to_frame(self.data.index, self.data.columns)
+        # Indicators are stored under this version so they are only reused for the same prices
+        self.data_version = self.store.version(self.data.index, self.data.columns)
+        self.ticker_positions = {ticker: j for j, ticker in enumerate(self.data.columns)}
+        # First row of each calendar lookback (such as the last five days) for every row
+        self.lookback_starts = {}
+        # Running sums answer the slope and mean deviation of any window in O(1). The compact store
+        # computes each window from its rows instead so it doesn't need the float64 running sums
+        if self.store.compact:
+            self.kernel = Indicators.WindowKernel(self.store)
+        else:
+            self.kernel = Indicators.PrefixSumKernel(self.prices)
+        self.median_windows = {}  # Rolling median of each ticker's most recent window
+        self.profiler = RunProfiler()  # Timings of the most recent run
+
+    def run_strategy(self, step_size, strategy, batched=True, verbosity=None, plot=True,
+                     start_row=0, end_row=None, indicator_cache=None, profile=False, trace_memory=False,
+                     on_step=None):
+        """Executes the specified trading strategy over defined period and returns a BacktestResults.
+        strategy is the name of a registered strategy (see Strategies.py) or a Strategy object.
+        When batched is True the indicators for every ticker are computed at once from the price matrix.
+        verbosity overrides the backtester's verbosity for this run. plot=True shows the results at the end,
+        a file path saves the plot to that file without opening a window and False skips plotting.
+        start_row and end_row limit the run to those rows of the data (inclusive) and indicator_cache is a
+        dictionary that stores the indicators of each window so other runs can reuse them (the backtester's
+        indicator_store is used if it is not given).
+        Every run records the time spent in each phase and the indicator calls in results.timings (see
+        Profiling.py). profile=True adds a cProfile report and trace_memory=True the peak traced memory.
+        on_step is called after every step with a dictionary of the step's dates, values and timings."""
+        strategy = get_strategy(strategy)
+        results = self.run_strategies(step_size, [strategy], batched, verbosity, plot, start_row, end_row,
+                                      indicator_cache, profile, trace_memory, on_step)[strategy.name]
+        self.portfolio_value = results.final_value  # updates portfolio value
+        return results
+
+    def run_strategies(self, step_size, strategies, batched=True, verbosity=None, plot=True,
+                       start_row=0, end_row=None, indicator_cache=None, profile=False, trace_memory=False,
+                       on_step=None):
+        """Runs several strategies in one pass over the trading days and returns a dictionary of
+        BacktestResults by strategy name. Each strategy trades its own portfolio starting from the current
+        portfolio value, and indicators shared by strategies (such as a strategy and its reverse) are only
+        computed once per step. The other arguments are the same as run_strategy."""
+        strategies = [get_strategy(strategy) for strategy in strategies]
+        verbosity = self.verbosity if verbosity is None else verbosity
+        self.profiler = RunProfiler(profile, trace_memory)
+        profiler = self.profiler
+        profiler.start()
         trading_days = self.data.index
-        start_idx = 0
-        value_history = [(trading_days[start_idx], self.portfolio_value)]
+        end_row = len(trading_days) - 1 if end_row is None else end_row
+        start_idx = start_row
+        step = 0
+        # Runs over part of the data are labelled with their own first and last trading day
+        run_start = self.start_date if start_row == 0 else trading_days[start_row]
+        run_end = self.end_date if end_row == len(trading_days) - 1 else trading_days[end_row]
+        # Portfolio value, indicators from the previous step and results of each strategy
+        values = {strategy.name: self.portfolio_value for strategy in strategies}
+        indicators = {}
+        results = start_results(strategies, step_size, run_start, run_end, trading_days[start_idx],
+                                self.portfolio_value)
+        active = list(strategies)  # Strategies whose portfolio value is still positive
 
         # Loops until the end of trading days
-        while start_idx < len(trading_days):
+        while start_idx <= end_row and active:
+            step_start = time.perf_counter()
             # Calculates start_time and end_time for the current step
-            end_idx = min(start_idx + step_size, len(trading_days) - 1)
+            end_idx = min(start_idx + step_size, end_row)
             start_time, end_time = trading_days[start_idx], trading_days[end_idx]
 
             # Buys and sells stocks based off of indicators from previous step and calculates returns
-            if start_idx > 0:  # No trades are placed on first step because there is no prior data
-
-                # Call preform step function with proper previous indicators
-                if (strategy == "linear regression") or (strategy == "reverse linear regression"):
-                    current_value, investments = self.perform_step(start_time, end_time, self.previous_slopes)
-                elif (strategy == "mean reversion") or (strategy == "reverse mean reversion"):
-                    current_value, investments = self.perform_step(start_time, end_time, self.previous_mean_deviations)
-                elif (strategy == "median reversion") or (strategy == "reverse median reversion"):
-                    current_value, investments = self.perform_step(start_time, end_time,
-                                                                   self.previous_median_deviations)
-                elif (strategy == "short and long term") or (strategy == "reverse short and long term"):
-                    current_value, investments = self.perform_step(start_time, end_time,
-                                                                   self.previous_combined_indicators)
-                else:
-                    print("Invalid strategy")
-                    current_value = 0
-                    investments = 0
-
-                # Print all trades and their returns for the most recent time step
-                print(f"\nFrom {start_time.date()} to {end_time.date()}:")
-                print("Trades executed:")
-                for trade_type, orders in investments.items():
-                    print(f"{trade_type.capitalize()}:")
-                    for ticker, amount in orders.items():
-                        print(f"  {ticker}: ${amount:.2f}")
-                print(f"Return after this period: ${current_value - self.portfolio_value:.2f}")
-
-                self.portfolio_value = current_value  # updates portfolio value
-                if self.portfolio_value <= 0:
-                    quit("Portfolio value zero or negative")
-                value_history.append((end_time, self.portfolio_value))  # updates value history for graphing later
+            if start_idx > start_row:  # No trades are placed on first step because there is no prior data
+                step += 1
+                trade_step(self, step, start_idx, end_idx, start_time, end_time, strategies, active, indicators,
+                           values, results, verbosity)
 
             # After the step is preformed: Update indicators for the next period
-            # Dictionary mapping strategies to their respective functions, indicators, and a reverse multiplier
-            strategy_config = {
-                "linear regression": (self.linear_regression_indicator, 'previous_slopes', 1),
-                "reverse linear regression": (self.linear_regression_indicator, 'previous_slopes', -1),
-                "mean reversion": (self.mean_deviation_indicator, 'previous_mean_deviations', 1),
-                "reverse mean reversion": (self.mean_deviation_indicator, 'previous_mean_deviations', -1),
-                "median reversion": (self.median_deviation_indicator, 'previous_median_deviations', 1),
-                "reverse median reversion": (self.median_deviation_indicator, 'previous_median_deviations', -1),
-                "short and long term": (self.combined_indicator, 'previous_combined_indicators', 1),
-                "reverse short and long term": (self.combined_indicator, 'previous_combined_indicators', -1)
-            }
-
-            # Executes the strategy and updates indicators
-            if strategy in strategy_config:
-                func, attr, multiplier = strategy_config[strategy]
-                # Calculates indicators for each ticker and stores them in the appropriate attribute
-                updated_indicators = {}
-                for ticker in self.tickers:
-                    # Updates the indicator by calling the appropriate function
+            # Indicators are shared within the step by strategies that use the same indicator and window
+            step_cache = self.run_cache(indicator_cache)
+            with profiler.phase('indicators'):
+                for strategy in active:
                     # Strategy is reversed by switching sign of indicator
-                    updated_indicators[ticker] = multiplier * func(ticker, start_time, end_time)
-                setattr(self, attr, updated_indicators)
-            else:
-                print("Invalid strategy")
+                    indicators[strategy.name] = strategy.multiplier * self.strategy_indicators(
+                        strategy, start_idx, end_idx, batched, step_cache)
+
+            report_step(on_step, step, start_time, end_time, values, active, step_start, profiler)
 
             # Shifts to the next time step
             start_idx = end_idx + 1
 
-        # When at the end of trading days plot results
-        self.plot_results(value_history, strategy, self.start_date, self.end_date, step_size)
-
-    def perform_step(self, start_time, end_time, indicators):
-        """Calculate buy and short orders based on previous period's indicators, then calculate returns."""
-        buy_orders, short_orders = self.allocate_funds(indicators)
-        returns = self.calculate_returns(buy_orders, short_orders, start_time, end_time)
+        return finish_results(results, profiler, verbosity, plot)
+
+    def accounting_engine(self, step_size, start_row=0, end_row=None):
+        """AccountingEngine (Accounting.py) with the steps and price ratios of a run from start_row to end_row"""
+        end_row = len(self.data.index) - 1 if end_row is None else end_row
+        starts, ends = step_schedule(start_row, end_row, step_size)
+        return AccountingEngine(self.prices, starts, ends)
+
+    def run_vectorized(self, step_size, strategies, batched=True, costs=(), verbosity=None, plot=False,
+                       start_row=0, end_row=None, indicator_cache=None, profile=False, trace_memory=False):
+        """Runs several strategies like run_strategies but with the portfolio accounting done once for the
+        whole step schedule by an AccountingEngine. The weights of every step are found first (they only depend
+        on the indicators), then the equity curve, profit and loss, turnover and costs are computed with array
+        operations. costs is a list of cost models such as LinearCost(0.0005) and SquareRootImpact(0.1).
+        Returns a dictionary of BacktestResults by strategy name with the per step arrays in results.accounting."""
+        strategies = [get_strategy(strategy) for strategy in strategies]
+        verbosity = self.verbosity if verbosity is None else verbosity
+        self.profiler = RunProfiler(profile, trace_memory)
+        profiler = self.profiler
+        profiler.start()
+        trading_days = self.data.index
+        end_row = len(trading_days) - 1 if end_row is None else end_row
+        with profiler.phase('schedule'):
+            engine = self.accounting_engine(step_size, start_row, end_row)
+        starts, ends = engine.starts, engine.ends
+        run_start = self.start_date if start_row == 0 else trading_days[start_row]
+        run_end = self.end_date if end_row == len(trading_days) - 1 else trading_days[end_row]
+        # Indicators are shared by strategies that use the same indicator and window
+        indicator_cache = self.run_cache(indicator_cache)
+        tickers = self.data.columns
+        results = {}
+        for strategy in strategies:
+            # Row k holds the weights traded in step k, which come from the indicators of step k - 1
+            weights = np.zeros((len(starts), len(tickers)))
+            selections = [None]
+            for k in range(len(starts) - 1):
+                with profiler.phase('indicators'):
+                    indicators = strategy.multiplier * self.strategy_indicators(
+                        strategy, starts[k], ends[k], batched, indicator_cache)
+                with profiler.phase('allocation'):
+                    buy_weights, short_weights, selected = allocate_weights(
+                        indicators, self.selection_fraction, self.max_positions, self.tie_break)
+                weights[k + 1] = buy_weights - short_weights
+                selections.append((indicators, buy_weights, short_weights, selected))
+            with profiler.phase('accounting'):
+                accounting = engine.run(weights, self.portfolio_value, costs)
+
+            result = BacktestResults(strategy.name, step_size, run_start, run_end, self.portfolio_value)
+            result.add_value(trading_days[starts[0]], self.portfolio_value)
+            values = accounting['values']
+            with profiler.phase('recording'):
+                for k in range(1, len(values)):
+                    start_time, end_time = trading_days[starts[k]], trading_days[ends[k]]
+                    buy_orders, short_orders = weights_to_orders(tickers, *selections[k], values[k - 1])
+                    investments = {'buy': buy_orders, 'short': short_orders}
+                    result.add_trades(k, start_time, end_time, investments)
+                    result.add_value(end_time, values[k])
+                    if verbosity >= 2:
+                        label = f"{strategy.name.title()} from" if len(strategies) > 1 else "From"
+                        print_trades(label, start_time, end_time, investments, accounting['pnl'][k])
+            if values[-1] <= 0:
+                if verbosity >= 1:
+                    print(f"{strategy.name.title()}: Portfolio value zero or negative")
+                result.busted = True
+            # The first step has no trades so the per step arrays start at the first trading step
+            result.accounting = {name: array[1:] for name, array in accounting.items()}
+            results[strategy.name] = result
+        return finish_results(results, profiler, verbosity, plot)
+
+    def lookback_start(self, lookback, start_idx, end_idx):
+        """First row of a strategy's lookback for the step from start_idx to end_idx"""
+        if lookback is None:
+            return start_idx  # Uses the rows of the step
+        if isinstance(lookback, (int, np.integer)):
+            return max(0, end_idx - lookback + 1)
+        # Calendar lookbacks are resolved once with searchsorted for every row and reused
+        if lookback not in self.lookback_starts:
+            trading_days = self.data.index
+            self.lookback_starts[lookback] = trading_days.searchsorted(trading_days - lookback)
+        return self.lookback_starts[lookback][end_idx]
+
+    def run_cache(self, indicator_cache):
+        """Cache of indicators for a run: the one passed in, the indicator store or a new dictionary"""
+        if indicator_cache is not None:
+            return indicator_cache
+        return self.indicator_store if self.indicator_store is not None else {}
+
+    def strategy_indicators(self, strategy, start_idx, end_idx, batched=True, indicator_cache=None):
+        """Indicators (before reversing) of a strategy for every ticker column for the step from start_idx
+        to end_idx. indicator_cache is an optional dictionary or IndicatorStore that shares them between runs."""
+        # Indicators only depend on the prices and the window so they are shared through the cache
+        cache_key = (self.data_version, strategy.indicator_key, batched, int(start_idx), int(end_idx))
+        cached = indicator_cache.get(cache_key) if indicator_cache is not None else None
+        if cached is not None:
+            self.profiler.cache_hits += 1
+            return cached
+        window_start = self.lookback_start(strategy.lookback, start_idx, end_idx)
+        if batched:
+            # Calculates indicators for all tickers at once over the rows of the window
+            indicators = strategy.indicator(self, window_start, end_idx)
+            self.profiler.count_indicator(strategy.indicator.__name__)
+        else:
+            # Calculates indicators for each ticker by calling the strategy's per ticker function
+            indicators = np.array([strategy.ticker_indicator(self, ticker, window_start, end_idx)
+                                   for ticker in self.data.columns], dtype=np.float64)
+            self.profiler.count_indicator(strategy.ticker_indicator.__name__, len(self.data.columns))
+        if indicator_cache is not None:
+            self.profiler.cache_misses += 1
+            indicator_cache[cache_key] = indicators
+        return indicators
+
+    def walk_forward(self, step_size, strategy, run_length=pd.DateOffset(years=3), frequency='MS', batched=True,
+                     aligned=False):
+        """Runs the strategy for run_length starting at every start date (the start of every month by default)
+        and returns a DataFrame with the final value, return and max drawdown of each run.
+        Each run starts on the first trading day on or after its start date. The indicators of every window
+        are shared through a cache, but two runs only have windows in common when their start rows are a
+        multiple of step_size + 1 apart, so most windows of monthly runs are computed once per run.
+        aligned=True moves each start forward onto a grid of steps shared by every run (at most step_size
+        trading days later) so the runs share every window they have in common. Start dates that move onto
+        the same row are run once, and the start_date column is the trading day each run really started on.
+        The share of windows reused from the cache is printed and kept in the attrs of the DataFrame as
+        cache_hit_rate."""
+        trading_days = self.data.index
+        indicator_cache = self.run_cache(None)
+        starting_value = self.portfolio_value
+        rows = []
+        hits = misses = 0
+        start_rows = trading_days.searchsorted(pd.date_range(trading_days[0], trading_days[-1] - run_length,
+                                                             freq=frequency))
+        if aligned:
+            start_rows = -(-start_rows // (step_size + 1)) * (step_size + 1)  # Rounds up to the grid
+            start_rows = start_rows[start_rows < len(trading_days)]
+        # Start dates that fall on the same trading day (such as a weekend and the Monday after) are run once
+        for start_row in dict.fromkeys(start_rows):
+            end_row = trading_days.searchsorted(trading_days[start_row] + run_length, side='right') - 1
+            self.portfolio_value = starting_value
+            results = self.run_strategy(step_size, strategy, batched=batched, verbosity=0, plot=False,
+                                        start_row=start_row, end_row=end_row, indicator_cache=indicator_cache)
+            hits += results.timings['cache_hits']
+            misses += results.timings['cache_misses']
+            rows.append({
+                'start_date': trading_days[start_row],
+                'end_date': trading_days[end_row],
+                'final_value': results.final_value,
+                'total_return': results.total_return,
+                'max_drawdown': results.max_drawdown
+            })
+        self.portfolio_value = starting_value
+        hit_rate = hits / (hits + misses) if hits + misses else None
+        if self.verbosity >= 1:
+            print(f"\n{len(rows)} runs, {misses} indicator windows computed and {hits} reused from the cache"
+                  + (f" ({hit_rate:.0%})" if hit_rate is not None else ""))
+        frame = pd.DataFrame(rows)
+        frame.attrs['cache_hit_rate'] = hit_rate
+        return frame
+
+    def perform_step(self, start_idx, end_idx, indicators, portfolio_value=None):
+        """Calculate buy and short orders based on previous period's indicators, then calculate returns.
+        indicators is an array with one entry per ticker column of the data. portfolio_value defaults to
+        the backtester's portfolio value."""
+        portfolio_value = self.portfolio_value if portfolio_value is None else portfolio_value
+        with self.profiler.phase('allocation'):
+            buy_weights, short_weights, selected = allocate_weights(indicators, self.selection_fraction,
+                                                                    self.max_positions, self.tie_break)
+        with self.profiler.phase('returns'):
+            returns = self.calculate_weight_returns(buy_weights, short_weights, selected, start_idx, end_idx,
+                                                    portfolio_value)
+        with self.profiler.phase('orders'):
+            buy_orders, short_orders = weights_to_orders(self.data.columns, indicators, buy_weights, short_weights,
+                                                         selected, portfolio_value)
         return returns, {'buy': buy_orders, 'short': short_orders}
 
-    def allocate_funds(self, indicators):
-        """Allocates funds to buy and sell based on indicators from the last time step using a heap"""
-        # Use a heap to store the indicators with their negative values for max-heap functionality
-        heap = []
-        for ticker, indicator in indicators.items():
-            # Push the negative because heapq is a min-heap by nature
-            heapq.heappush(heap, (-abs(indicator), ticker, indicator))
-
-        num_to_select = max(1, len(indicators) // 10)  # Trading the top 10% of stocks by indicator magnitude
-        buy_orders = {}
-        short_orders = {}
-
-        # Extract the top indicators from the heap
-        top_tickers = [heapq.heappop(heap) for _ in range(num_to_select)]
-        total_magnitude = sum(-item[0] for item in top_tickers)
-
-        # Calculate proportion of the total value of the portfolio to put towards each trade
-        for i, ticker, indicator in top_tickers:
-            proportion = abs(indicator) / total_magnitude
-            trade_value = self.portfolio_value * proportion
-            if indicator > 0:
-                buy_orders[ticker] = trade_value
-            else:
-                short_orders[ticker] = trade_value
-
-        return buy_orders, short_orders
-
-    def calculate_returns(self, buy_orders, short_orders, start_time, end_time):
-        """Calculates returns from buy and short positions based on actual price changes"""
-        end_prices = self.data.loc[end_time]
-        start_prices = self.data.loc[start_time]
-
-        buy_return = sum(((end_prices.get(ticker) / start_prices.get(ticker)) - 1) * amount for ticker, amount in
-                         buy_orders.items())
-        short_return = sum((1 - (end_prices.get(ticker) / start_prices.get(ticker))) * amount for ticker, amount in
-                           short_orders.items())
-
-        return self.portfolio_value + buy_return + short_return
-
-    def linear_regression_indicator(self, ticker, start_time, end_time):
+    def calculate_weight_returns(self, buy_weights, short_weights, selected, start_idx, end_idx, portfolio_value):
+        """Calculates the portfolio value after holding the weighted positions from row start_idx to end_idx"""
+        ratios = self.store.row(end_idx, selected) / self.store.row(start_idx, selected)
+        gain = np.dot(buy_weights[selected], ratios - 1) + np.dot(short_weights[selected], 1 - ratios)
+        return portfolio_value + portfolio_value * gain
+
+    def ticker_prices(self, ticker, start_idx, end_idx):
+        """Valid prices of a ticker from row start_idx to row end_idx (inclusive)"""
+        return self.store.column(self.ticker_positions[ticker], start_idx, end_idx)
+
+    def linear_regression_indicator(self, ticker, start_idx, end_idx):
         """Performs linear regression on stock prices to return the slope"""
-        prices = self.data[ticker].loc[start_time:end_time].dropna()
+        prices = self.ticker_prices(ticker, start_idx, end_idx)
         if len(prices) < 2:
             return 0  # Not enough data points for a regression
-        x = np.arange(len(prices)).reshape(-1, 1)
-        y = prices.values
-        model = LinearRegression()
-        model.fit(x, y)
+        # Least squares slope of the prices against x = 0..n-1
+        x = np.arange(len(prices)) - (len(prices) - 1) / 2.0
+        y = prices
+        slope = np.dot(x, y - y.mean()) / np.dot(x, x)
         # Slope is used as the indicator to buy or sell for linear regression positive slope = buy; negative = sell
         # Slope is divided by last price to make indicators meaningfully comparable
-        return model.coef_[0]/prices.iloc[-1]
+        return slope/prices[-1]
 
-    def mean_deviation_indicator(self, ticker, start_time, end_time):
+    def mean_deviation_indicator(self, ticker, start_idx, end_idx):
         """Calculate the deviation from the mean for a ticker"""
-        prices = self.data[ticker].loc[start_time:end_time].dropna()
-        if prices.empty:
+        prices = self.ticker_prices(ticker, start_idx, end_idx)
+        if len(prices) == 0:
             return 0
         mean_price = prices.mean()
         # (-Mean deviation/ mean price) is used as the indicator for mean reversion.
         # If the stock is above the mean price sell and if it is below the mean price buy
         # The deviation is divided by mean price to make indicators meaningfully comparable
-        last_price = prices.iloc[-1]
+        last_price = prices[-1]
         return (mean_price - last_price) / mean_price
 
-    def median_deviation_indicator(self, ticker, start_time, end_time):
-        """Calculate the deviation from the median for a ticker using BST with in-order traversal."""
-        prices = self.data[ticker].loc[start_time:end_time].dropna()
-        if prices.empty:
-            return 0  # Return 0 deviation if no prices are available
-
-        bst = BST()
-        root = None
-        # Insert all price data into the BST
-        for price in prices:
-            root = bst.insert(root, price)  # Always update the root in case it changes
-
-        # Find the median using in-order traversal
-        median_price = bst.find_median(root)
+    def median_deviation_indicator(self, ticker, start_idx, end_idx):
+        """Calculate the deviation from the median for a ticker using a rolling two heap median."""
+        rolling = self.median_windows.get(ticker)
+        first_new = start_idx
+        if rolling is None or start_idx < rolling.start or end_idx < rolling.end:
+            # Window moved backwards (e.g. a new run) so the rolling median is started over
+            rolling = RollingMedian()
+            self.median_windows[ticker] = rolling
+        else:
+            # Only the prices after the previous window are inserted and prices before the window are evicted
+            first_new = max(start_idx, rolling.end + 1)
+        column = self.ticker_positions[ticker]
+        for row in range(first_new, end_idx + 1):
+            price = self.prices[row, column]
+            if not np.isnan(price):
+                rolling.insert(row, float(price))
+        rolling.evict_before(start_idx)
+        rolling.start, rolling.end = start_idx, end_idx
+
+        median_price = rolling.median()
         if median_price is None:
-            return 0  # Return 0 deviation if median calculation fails
+            return 0  # Return 0 deviation if no prices are available
 
         # (-Median deviation/ median price) is used as the indicator for median reversion.
         # If the stock is above the median price sell and if it is below the median price buy
         # The deviation is divided by median price to make indicators meaningfully comparable
-        last_price = prices.iloc[-1]
+        last_price = rolling.last_price()
         return (median_price - last_price) / median_price
 
-    def combined_indicator(self, ticker, start_time, end_time):
+    def combined_indicator(self, ticker, start_idx, end_idx):
         """Uses the linear regression over the long term and mean deviation over the short term"""
         # Uses last five days for mean reversion indicator
-        period_for_mean = end_time - pd.Timedelta(days=5)
-        mean_deviation_indicator = self.mean_deviation_indicator(ticker, period_for_mean, end_time)
+        period_for_mean = self.lookback_start(COMBINED_LOOKBACK, start_idx, end_idx)
+        mean_deviation_indicator = self.mean_deviation_indicator(ticker, period_for_mean, end_idx)
 
         # Uses the entire step size for linear regression indicator
-        linear_regression_indicator = self.linear_regression_indicator(ticker, period_for_mean, end_time)
+        linear_regression_indicator = self.linear_regression_indicator(ticker, period_for_mean, end_idx)
 
         # Adds indicators together
         combined_value = mean_deviation_indicator + linear_regression_indicator
         return combined_value
-
-    def plot_results(self, value_history, strategy, start_date, end_date, step_size):
-        """Plot the value of the portfolio over time with appropriate title."""
-        dates, values = zip(*value_history)
-        plt.figure(figsize=(10, 5))
-        plt.plot(dates, values, 'o-')
-        title = f"{strategy.title()} Strategy: {start_date.date()} to {end_date.date()}, Step Size: {step_size}"
-        plt.title(title)
-        plt.xlabel("Date")
-        plt.ylabel("Portfolio Value ($)")
-        plt.grid(True)
-        plt.show()
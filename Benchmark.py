@@ -0,0 +1,243 @@
+"""
+Benchmark suite for the backtester hot paths.
+
+Uses synthetic prices from SyntheticData.py so it runs offline. For every universe size
+it times each strategy at several step sizes (run_strategy end to end) and the hot paths
+on their own: the per ticker and batched indicator methods, allocate_weights and
+calculate_weight_returns. It also compares the rolling two heap median against rebuilding a BST
+for every window. Each benchmark is timed without tracing and then run again under
+tracemalloc to record its peak memory. The ConcurrentLoader is timed loading the synthetic
+prices from local files with an unknown ticker added, which must be reported as a failure.
+The prices can be kept in the dense float64 store or the compact float32 store (--storage
+compact, see PriceStore.py), and the size of the store and the peak resident memory of the
+process are recorded so both can be compared.
+
+The results are printed and written as JSON so runs before and after a change can be compared:
+python Benchmark.py --tickers 100 1000 5000 --step-sizes 5 60 --output benchmark_results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from Allocation import allocate_weights
+from Backtester import Backtester
+from BST import BST
+from DataSources import ConcurrentLoader, LocalFileSource
+import Indicators
+from RollingMedian import RollingMedian
+from SyntheticData import generate_prices
+
+try:
+    import resource  # Only available on Unix
+except ImportError:
+    resource = None
+
+STRATEGIES = ["linear regression", "mean reversion", "median reversion", "short and long term"]
+
+
+def measure(func, memory=True):
+    """Returns the run time in seconds of func() and its peak traced memory in MB (None if memory is False)"""
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return seconds, peak_mb
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process in MB (None where the resource module is missing)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS reports bytes
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def bst_medians(prices, window_size):
+    """Builds a new BST for every window and finds the median with in-order traversal"""
+    medians = []
+    for end in range(len(prices)):
+        bst = BST()
+        root = None
+        for price in prices[max(0, end - window_size + 1):end + 1]:
+            root = bst.insert(root, price)
+        medians.append(bst.find_median(root))
+    return medians
+
+
+def rolling_medians(prices, window_size):
+    """Moves one rolling median forward one price at a time"""
+    medians = []
+    rolling = RollingMedian()
+    for end, price in enumerate(prices):
+        rolling.insert(end, price)
+        rolling.evict_before(end - window_size + 1)
+        medians.append(rolling.median())
+    return medians
+
+
+def benchmark_median(num_days=2520, window_sizes=(5, 60, 250, 2520), seed=0):
+    """Times both median methods sliding one day at a time over random walk and trending prices.
+    The trending prices are the worst case for the unbalanced BST."""
+    rng = np.random.default_rng(seed)
+    price_series = {
+        'random walk': list(100 * np.exp(np.cumsum(rng.normal(0, 0.02, num_days)))),
+        'trending': list(100 + 0.1 * np.arange(num_days))
+    }
+    records = []
+    for name, prices in price_series.items():
+        for window_size in window_sizes:
+            for method, func in (('bst', bst_medians), ('rolling', rolling_medians)):
+                record = {'benchmark': 'median', 'name': f"{method} {name}", 'days': num_days,
+                          'window_size': window_size}
+                try:
+                    record['seconds'], _ = measure(lambda: func(prices, window_size), memory=False)
+                except RecursionError:
+                    record['seconds'] = None  # The BST is too deep for Python's recursion limit
+                records.append(record)
+    return records
+
+
+def benchmark_strategies(backtester, step_sizes, per_ticker_limit, memory):
+    """Times every strategy end to end with batched indicators (and per ticker ones for small universes),
+    and with the vectorized accounting of run_vectorized"""
+    num_days, num_tickers = backtester.prices.shape
+    modes = [True] if num_tickers > per_ticker_limit else [True, False]
+    records = []
+    for strategy in STRATEGIES:
+        for step_size in step_sizes:
+            for batched in modes:
+                def run():
+                    backtester.portfolio_value = backtester.amount
+                    backtester.median_windows = {}
+                    backtester.run_strategy(step_size, strategy, batched=batched, verbosity=0, plot=False)
+                seconds, peak_mb = measure(run, memory)
+                records.append({'benchmark': 'strategy', 'name': strategy, 'batched': batched,
+                                'accounting': 'loop', 'tickers': num_tickers, 'days': num_days,
+                                'step_size': step_size, 'seconds': seconds, 'peak_mb': peak_mb})
+            # Same run with the accounting done by the vectorized AccountingEngine
+            seconds, peak_mb = measure(lambda: backtester.run_vectorized(step_size, [strategy], verbosity=0), memory)
+            records.append({'benchmark': 'strategy', 'name': strategy, 'batched': True, 'accounting': 'vectorized',
+                            'tickers': num_tickers, 'days': num_days, 'step_size': step_size,
+                            'seconds': seconds, 'peak_mb': peak_mb})
+    return records
+
+
+def benchmark_hot_paths(backtester, step_size, num_windows, per_ticker_limit, memory):
+    """Times the indicator methods, allocate_weights and calculate_weight_returns over num_windows steps"""
+    num_days, num_tickers = backtester.prices.shape
+    windows = [(start, start + step_size) for start in range(0, num_days - step_size, step_size + 1)][:num_windows]
+    tickers = list(backtester.data.columns)
+    kernel = backtester.kernel
+    batched_methods = {
+        'linear_regression_indicator': kernel.slope_indicator,
+        'mean_deviation_indicator': kernel.mean_deviation_indicator,
+        'median_deviation_indicator': lambda start, end: Indicators.median_deviation_indicator(
+            *backtester.store.window(start, end)),
+        'combined_indicator': kernel.combined_indicator
+    }
+    records = []
+
+    def add(name, func, batched=True):
+        seconds, peak_mb = measure(func, memory)
+        records.append({'benchmark': 'hot path', 'name': name, 'batched': batched, 'tickers': num_tickers,
+                        'days': num_days, 'step_size': step_size, 'seconds': seconds / len(windows),
+                        'peak_mb': peak_mb})
+
+    for name, batched_method in batched_methods.items():
+        add(name, lambda: [batched_method(start, end) for start, end in windows])
+        if num_tickers <= per_ticker_limit:
+            method = getattr(backtester, name)
+            add(name, lambda: [method(ticker, start, end) for start, end in windows for ticker in tickers],
+                batched=False)
+
+    indicator_array = kernel.slope_indicator(0, step_size)
+    add('allocate_weights', lambda: [allocate_weights(indicator_array) for _ in windows])
+    buy_weights, short_weights, selected = allocate_weights(indicator_array)
+    add('calculate_weight_returns', lambda: [backtester.calculate_weight_returns(
+        buy_weights, short_weights, selected, start, end, backtester.amount) for start, end in windows])
+    return records
+
+
+def benchmark_loader(data, batch_size=50, max_workers=4):
+    """Times the ConcurrentLoader reading the prices from one CSV file per ticker with an unknown ticker added"""
+    with tempfile.TemporaryDirectory() as folder:
+        for ticker in data.columns:
+            data[[ticker]].rename(columns={ticker: 'Close'}).to_csv(os.path.join(folder, f"{ticker}.csv"))
+        loader = ConcurrentLoader(LocalFileSource(folder), batch_size, max_workers, retries=0)
+        tickers = list(data.columns) + ['UNKNOWN']
+        start = time.perf_counter()
+        prices, failures = loader.fetch(tickers, data.index[0], data.index[-1] + pd.Timedelta(days=1))
+        seconds = time.perf_counter() - start
+    if failures != {'UNKNOWN': "no data"} or list(prices.columns) != list(data.columns):
+        raise RuntimeError(f"ConcurrentLoader lost tickers or reported the wrong failures: {failures}")
+    return [{'benchmark': 'loader', 'name': 'ConcurrentLoader', 'tickers': len(tickers), 'days': len(data),
+             'batch_size': batch_size, 'seconds': seconds, 'failures': len(failures)}]
+
+
+def run_suite(ticker_counts=(100, 1000, 5000), num_days=2520, step_sizes=(5, 60), nan_density=0.01,
+              per_ticker_limit=100, num_windows=50, memory=True, seed=0, storage='dense', memmap_dir=None):
+    """Runs every benchmark and returns a list of result records. storage and memmap_dir choose the
+    price store of the backtester."""
+    records = benchmark_median(num_days)
+    for num_tickers in ticker_counts:
+        data = generate_prices(num_tickers, num_days, nan_density, seed=seed)
+        backtester = None
+
+        def setup():
+            nonlocal backtester
+            backtester = Backtester(list(data.columns), data.index[0], data.index[-1], 10000, data=data,
+                                    verbosity=0, storage=storage, memmap_dir=memmap_dir)
+        seconds, peak_mb = measure(setup, memory)
+        records.append({'benchmark': 'setup', 'name': 'prepare_data', 'storage': storage, 'tickers': num_tickers,
+                        'days': num_days, 'seconds': seconds, 'peak_mb': peak_mb,
+                        'store_mb': backtester.store.nbytes / 1e6})
+        records += benchmark_strategies(backtester, step_sizes, per_ticker_limit, memory)
+        records += benchmark_hot_paths(backtester, min(step_sizes), num_windows, per_ticker_limit, memory)
+        records += benchmark_loader(data)
+        # Peak resident memory only grows so each record is the peak up to the end of that universe
+        records.append({'benchmark': 'process', 'name': 'peak_rss', 'storage': storage, 'tickers': num_tickers,
+                        'days': num_days, 'peak_rss_mb': peak_rss_mb()})
+    return records
+
+
+def main():
+    """Parses the benchmark parameters, runs the suite, prints the results and writes them to JSON"""
+    parser = argparse.ArgumentParser(description="Benchmarks the backtester on synthetic prices")
+    parser.add_argument('--tickers', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--step-sizes', type=int, nargs='+', default=[5, 60])
+    parser.add_argument('--nan-density', type=float, default=0.01)
+    parser.add_argument('--per-ticker-limit', type=int, default=100,
+                        help="largest universe that also runs the slow per ticker indicators")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', choices=['dense', 'compact'], default='dense',
+                        help="float64 prices or float32 prices with a validity bitmap")
+    parser.add_argument('--memmap-dir', help="memory-maps the compact prices from a file in this directory")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    records = run_suite(args.tickers, args.days, args.step_sizes, args.nan_density, args.per_ticker_limit,
+                        memory=not args.no_memory, seed=args.seed, storage=args.storage,
+                        memmap_dir=args.memmap_dir)
+    print(pd.DataFrame(records).to_string(index=False))
+    with open(args.output, 'w') as output_file:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                   'arguments': vars(args), 'results': records}, output_file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
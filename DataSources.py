@@ -0,0 +1,308 @@
+"""
+Data sources for the backtester and a local on-disk price cache.
+
+A data source returns closing prices for a list of tickers over a date range as a
+DataFrame with the trading days as rows and the tickers as columns (like
+yf.download(...)['Close']). The end date is exclusive just like yfinance.
+
+YFinanceSource downloads the prices of each ticker from yfinance.
+LocalFileSource reads the prices from local CSV/Parquet files so backtests can be run offline.
+ConcurrentLoader wraps another source and fetches the tickers in batches from a thread pool
+with retries, so one slow or failing ticker does not stop the others from loading.
+fetch returns the prices together with the tickers that could not be loaded and the reason,
+so every call gets its own failures even when several run at once.
+PriceCache stores the prices of each ticker on disk and only asks the source it wraps for
+the tickers and date ranges that are not cached yet.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import pandas as pd
+
+try:
+    import pyarrow  # Parquet support for pandas
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'csv'
+
+
+def read_prices_file(path):
+    """Reads a CSV or Parquet price file with the dates as the index"""
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path, index_col=0, parse_dates=True)
+    frame.index = pd.to_datetime(frame.index)
+    return frame
+
+
+def write_prices_file(frame, path):
+    """Writes a price frame to a CSV or Parquet file depending on the extension"""
+    if path.endswith('.parquet'):
+        frame.to_parquet(path)
+    else:
+        frame.to_csv(path)
+
+
+def add_missing(tickers, prices, failures):
+    """Returns a copy of the failures with the other tickers that have no prices in the frame added as no data"""
+    failures = dict(failures)
+    for ticker in tickers:
+        if ticker not in failures and (ticker not in prices.columns or prices[ticker].isna().all()):
+            failures[ticker] = "no data"
+    return failures
+
+
+class DataSource:
+    """Interface for anything that can supply closing prices to the backtester"""
+    def get_prices(self, tickers, start_date, end_date):
+        """Returns closing prices with dates as rows and tickers as columns for [start_date, end_date)"""
+        raise NotImplementedError
+
+    def fetch(self, tickers, start_date, end_date):
+        """Returns the prices like get_prices and a dictionary of the tickers that could not be loaded
+        with the reason. Sources that know why a ticker failed override this."""
+        prices = self.get_prices(tickers, start_date, end_date)
+        return prices, add_missing(tickers, prices, {})
+
+
+class YFinanceSource(DataSource):
+    def get_prices(self, tickers, start_date, end_date):
+        """Downloads the closing prices from yfinance"""
+        return self.fetch(tickers, start_date, end_date)[0]
+
+    def fetch(self, tickers, start_date, end_date):
+        """Downloads each ticker with yf.Ticker(...).history, which keeps no state shared between calls
+        (unlike yf.download) so several batches can download at once. The error of a ticker is its reason."""
+        import yfinance as yf  # Imported here so offline runs do not need yfinance installed
+        columns = {}
+        failures = {}
+        for ticker in tickers:
+            try:
+                history = yf.Ticker(ticker).history(start=start_date, end=end_date, raise_errors=True)
+            except Exception as exception:  # Unknown, delisted or rate limited tickers
+                failures[ticker] = f"{type(exception).__name__}: {exception}"
+                continue
+            if history.empty or history['Close'].isna().all():
+                failures[ticker] = "no data"
+                continue
+            closes = history['Close']
+            # history uses the exchange's time zone, the rest of the backtester uses plain dates
+            closes.index = pd.DatetimeIndex(closes.index).tz_localize(None).normalize()
+            columns[ticker] = closes
+        if not columns:
+            return pd.DataFrame(index=pd.DatetimeIndex([])), failures
+        return pd.DataFrame(columns).sort_index().sort_index(axis=1), failures  # Tickers sorted like yf.download
+
+
+class LocalFileSource(DataSource):
+    def __init__(self, path):
+        """path is either a directory with one file per ticker (e.g. AAPL.csv or AAPL.parquet with
+        a date index and a Close column) or a single file with a date index and one column per ticker"""
+        self.path = path
+        self.wide = None
+        if os.path.isfile(path):
+            self.wide = read_prices_file(path)
+
+    def read_ticker(self, ticker):
+        """Reads the closing prices of one ticker from its file in the directory"""
+        for extension in ('.parquet', '.csv'):
+            file_path = os.path.join(self.path, ticker + extension)
+            if os.path.exists(file_path):
+                frame = read_prices_file(file_path)
+                return frame['Close'] if 'Close' in frame.columns else frame.iloc[:, 0]
+        return None
+
+    def get_prices(self, tickers, start_date, end_date):
+        """Returns the prices of the tickers found locally, missing tickers are left out"""
+        if self.wide is not None:
+            columns = {ticker: self.wide[ticker] for ticker in tickers if ticker in self.wide.columns}
+        else:
+            columns = {}
+            for ticker in tickers:
+                prices = self.read_ticker(ticker)
+                if prices is not None:
+                    columns[ticker] = prices
+        if not columns:
+            return pd.DataFrame(index=pd.DatetimeIndex([]))  # None of the tickers have a file
+        frame = pd.DataFrame(columns).sort_index().sort_index(axis=1)
+        start_date, end_date = pd.to_datetime(start_date), pd.to_datetime(end_date)
+        return frame[(frame.index >= start_date) & (frame.index < end_date)]
+
+
+class PriceCache(DataSource):
+    def __init__(self, cache_dir, source=None):
+        """Caches the prices of each ticker in cache_dir and fetches anything missing from source"""
+        self.cache_dir = cache_dir
+        self.source = source if source is not None else YFinanceSource()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Maps each ticker to the [start, end) date range stored in its cache file
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.ranges = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                self.ranges = {ticker: (pd.to_datetime(start), pd.to_datetime(end))
+                               for ticker, (start, end) in json.load(index_file).items()}
+
+    def ticker_path(self, ticker):
+        """Path of the cache file of a ticker"""
+        return os.path.join(self.cache_dir, f"{ticker}.{CACHE_FORMAT}")
+
+    def missing_ranges(self, ticker, start_date, end_date):
+        """Returns the date ranges of the request that are not in the cache for a ticker"""
+        if ticker not in self.ranges:
+            return [(start_date, end_date)]
+        cached_start, cached_end = self.ranges[ticker]
+        missing = []
+        if start_date < cached_start:
+            missing.append((start_date, cached_start))
+        if end_date > cached_end:
+            missing.append((cached_end, end_date))
+        return missing
+
+    def get_prices(self, tickers, start_date, end_date):
+        """Serves cached prices from disk and fetches only the missing tickers and date ranges"""
+        return self.fetch(tickers, start_date, end_date)[0]
+
+    def fetch(self, tickers, start_date, end_date):
+        """Same as get_prices but also returns the tickers the source could not load and the reason"""
+        start_date, end_date = pd.to_datetime(start_date), pd.to_datetime(end_date)
+        tickers = list(dict.fromkeys(tickers))  # Removes duplicate tickers and keeps the order
+
+        # Groups tickers by missing date range so each range is fetched with one call
+        to_fetch = {}
+        for ticker in tickers:
+            for date_range in self.missing_ranges(ticker, start_date, end_date):
+                to_fetch.setdefault(date_range, []).append(ticker)
+
+        fetched = {}
+        covered = {}  # Date ranges that came back with prices for each ticker
+        failures = {}
+        for (fetch_start, fetch_end), fetch_tickers in to_fetch.items():
+            prices, fetch_failures = self.source.fetch(fetch_tickers, fetch_start, fetch_end)
+            failures.update(fetch_failures)
+            for ticker in fetch_tickers:
+                if ticker in fetch_failures or ticker not in prices.columns:
+                    continue
+                ticker_prices = prices[ticker].dropna()
+                if ticker_prices.empty:
+                    continue  # yfinance reports a failed download as an empty column so nothing is cached
+                fetched.setdefault(ticker, []).append(ticker_prices)
+                if ticker in self.ranges and fetch_end <= self.ranges[ticker][0]:
+                    covered_end = fetch_end  # The range before the cached prices ends where they start
+                else:
+                    # Dates after the last bar may not be published yet so they are not marked as cached
+                    covered_end = min(fetch_end, ticker_prices.index[-1] + pd.Timedelta(days=1))
+                covered.setdefault(ticker, []).append((fetch_start, covered_end))
+
+        columns = {}
+        for ticker in tickers:
+            cached = None
+            if ticker in self.ranges and os.path.exists(self.ticker_path(ticker)):
+                cached = read_prices_file(self.ticker_path(ticker))['Close']
+            if ticker in fetched:
+                # Merges the new prices into the cache file and widens its stored range
+                parts = ([cached] if cached is not None else []) + fetched[ticker]
+                cached = pd.concat(parts).sort_index()
+                cached = cached[~cached.index.duplicated(keep='last')]
+                write_prices_file(cached.to_frame('Close'), self.ticker_path(ticker))
+                # Widens the stored range with the fetched ranges that touch it
+                cached_start, cached_end = self.ranges.get(ticker, covered[ticker][0])
+                for covered_start, covered_end in sorted(covered[ticker]):
+                    if covered_start <= cached_end and covered_end >= cached_start:
+                        cached_start, cached_end = min(cached_start, covered_start), max(cached_end, covered_end)
+                self.ranges[ticker] = (cached_start, cached_end)
+            if cached is not None:
+                columns[ticker] = cached[(cached.index >= start_date) & (cached.index < end_date)]
+
+        if fetched:
+            self.save_index()
+        # Tickers served from the cache are not failures even if this fetch of a newer range failed
+        failures = {ticker: reason for ticker, reason in failures.items() if ticker not in columns}
+        return pd.DataFrame(columns).sort_index().sort_index(axis=1), failures  # Tickers sorted like yfinance
+
+    def save_index(self):
+        """Writes the cached date range of every ticker to the index file"""
+        with open(self.index_path, 'w') as index_file:
+            json.dump({ticker: [str(start.date()), str(end.date())]
+                       for ticker, (start, end) in self.ranges.items()}, index_file, indent=1)
+
+
+class ConcurrentLoader(DataSource):
+    def __init__(self, source=None, batch_size=10, max_workers=4, retries=3, backoff=1.0, timeout=None):
+        """Fetches the tickers from source in batches of batch_size with at most max_workers batches at once.
+        A failed batch is tried again up to retries times, waiting backoff seconds and then twice as long
+        each time. If it still fails its tickers are fetched one at a time so only the bad tickers are lost.
+        timeout is the most seconds to wait for all the batches; tickers not loaded by then are failures."""
+        self.source = source if source is not None else YFinanceSource()
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def fetch_batch(self, tickers, start_date, end_date):
+        """Fetches one batch with retries. Returns the prices and the failures of the batch. Tickers that
+        fail or come back without prices are tried again too, since yfinance reports a failed download
+        as an empty column instead of raising."""
+        frames = []
+        failures = {}
+        pending = list(tickers)  # Tickers not loaded yet
+        error = None  # Error raised by the last try for the whole batch
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))  # Exponential backoff between tries
+            try:
+                prices, fetch_failures = self.source.fetch(pending, start_date, end_date)
+            except Exception as exception:  # Any error of the source counts as a failed try
+                error = f"{type(exception).__name__}: {exception}"
+                continue
+            error = None
+            failures = add_missing(pending, prices, fetch_failures)
+            frames.append(prices[[ticker for ticker in pending if ticker not in failures]])
+            pending = [ticker for ticker in pending if ticker in failures]
+            if not pending:
+                break
+
+        if error is not None and len(pending) > 1:
+            # Splits the batch so one bad ticker does not fail the others
+            results = [self.fetch_batch([ticker], start_date, end_date) for ticker in pending]
+            frames += [result[0] for result in results]
+            failures = {ticker: reason for result in results for ticker, reason in result[1].items()}
+        elif error is not None:
+            failures = {pending[0]: error}
+        else:
+            failures = {ticker: failures[ticker] for ticker in pending}
+        frames = [frame for frame in frames if len(frame.columns)]
+        if not frames:
+            return pd.DataFrame(index=pd.DatetimeIndex([])), failures
+        return pd.concat(frames, axis=1), failures
+
+    def get_prices(self, tickers, start_date, end_date):
+        """Fetches the batches concurrently and returns the prices of every ticker that loaded"""
+        return self.fetch(tickers, start_date, end_date)[0]
+
+    def fetch(self, tickers, start_date, end_date):
+        """Same as get_prices but also returns the tickers that did not load and the reason"""
+        tickers = list(dict.fromkeys(tickers))  # Removes duplicate tickers and keeps the order
+        batches = [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {executor.submit(self.fetch_batch, batch, start_date, end_date): batch for batch in batches}
+        done, not_done = wait(futures, timeout=self.timeout)
+        # Batches still running are abandoned instead of holding up the run
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        frames = []
+        failures = {}
+        for future, batch in futures.items():
+            if future in not_done:
+                failures.update({ticker: "timed out" for ticker in batch})
+                continue
+            prices, batch_failures = future.result()
+            frames.append(prices)
+            failures.update(batch_failures)
+        if not any(len(frame.columns) for frame in frames):
+            return pd.DataFrame(index=pd.DatetimeIndex([])), failures
+        return pd.concat(frames, axis=1).sort_index().sort_index(axis=1), failures  # Tickers sorted like yfinance
@@ -0,0 +1,127 @@
+"""
+Indicator store that lets repeated runs reuse computed indicators.
+
+The indicators of a window are a pure function of the price data, so they only need to be
+computed once for every (indicator, window, data version). The data version is a hash of
+the prices, dates and tickers (PriceStore.version), so the entries of one universe and
+price history are never used for another and refreshing the prices invalidates them.
+Each entry holds the indicators of every ticker of the universe for one window.
+
+Entries are kept in an in-memory LRU limited by size and, if a cache_dir is given, also
+saved as .npy files in one folder per data version so later runs (such as running a tester
+file again with another step size, starting amount or allocation rule) can load them
+instead of recomputing them. Only indicators of strategies with an explicit key and
+version (see Strategies.py) are saved to disk: other strategies are keyed by their
+function objects, which are not the same from one run of Python to the next.
+The strategy's version is part of the key, so raising it after changing an indicator stops
+the old saved results from being used. Only the folders of the max_versions most recently
+used data versions are kept, so refreshing the prices does not fill the disk with folders
+that will never be read again. The hit and miss counters show how much was reused.
+"""
+
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+import numpy as np
+
+
+class IndicatorStore:
+    def __init__(self, max_bytes=256 * 1024 * 1024, cache_dir=None, max_versions=4):
+        """max_bytes limits the memory used by the in-memory entries. cache_dir is an optional folder where
+        every entry is also saved, keeping the folders of at most max_versions data versions."""
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_versions = max_versions
+        self.used_versions = set()  # Data versions whose folders were used by this store
+        self.entries = OrderedDict()  # Least recently used entries first
+        self.nbytes = 0
+        self.hits = 0  # Entries found in memory
+        self.disk_hits = 0  # Entries loaded from cache_dir
+        self.misses = 0  # Entries that had to be computed
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.prune()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def persistent(self, key):
+        """True if the entry can be saved to cache_dir. Keys are (data version, strategy.indicator_key, ...)
+        and the indicator key starts with the strategy's key string when it has one."""
+        return self.cache_dir is not None and isinstance(key[1][0], str)
+
+    def path(self, key):
+        """File of an entry: keys start with the data version, which is the folder of the file"""
+        name = hashlib.sha1(repr(key[1:]).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[0], name + '.npy')
+
+    def get(self, key, default=None):
+        """Returns the indicators stored for the key (default if they are not stored)"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.persistent(key) and os.path.exists(self.path(key)):
+            self.use_version(key[0])
+            indicators = np.load(self.path(key))
+            self.disk_hits += 1
+            self.remember(key, indicators)
+            return indicators
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, indicators):
+        """Stores the indicators in memory and in cache_dir if the key is persistent"""
+        self.remember(key, indicators)
+        if self.persistent(key):
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.use_version(key[0])
+            # Written to a temporary file first so other runs never load half written entries
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'wb') as entry_file:
+                np.save(entry_file, indicators)
+            os.replace(temporary_path, path)
+
+    def remember(self, key, indicators):
+        """Adds an entry to the in-memory LRU and drops the least recently used entries over max_bytes"""
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key] = indicators
+        self.nbytes += indicators.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+
+    def use_version(self, version):
+        """Marks a data version's folder as recently used and prunes old folders the first time it is used"""
+        if version in self.used_versions:
+            return
+        self.used_versions.add(version)
+        folder = os.path.join(self.cache_dir, version)
+        if os.path.isdir(folder):
+            os.utime(folder)
+        self.prune()
+
+    def prune(self):
+        """Removes the folders of the least recently used data versions over max_versions from cache_dir"""
+        folders = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        folders = sorted((folder for folder in folders if os.path.isdir(folder)), key=os.path.getmtime)
+        for folder in folders[:max(0, len(folders) - self.max_versions)]:
+            shutil.rmtree(folder)
+
+    def invalidate(self, keep_version=None):
+        """Removes the entries of every data version except keep_version from memory and cache_dir"""
+        for key in [key for key in self.entries if key[0] != keep_version]:
+            self.nbytes -= self.entries.pop(key).nbytes
+        if self.cache_dir is not None:
+            for version in os.listdir(self.cache_dir):
+                if version != keep_version and os.path.isdir(os.path.join(self.cache_dir, version)):
+                    shutil.rmtree(os.path.join(self.cache_dir, version))
+
+    def stats(self):
+        """Hit and miss counters and the size of the in-memory tier"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None,
+                'entries': len(self.entries), 'memory_mb': self.nbytes / 1e6}
@@ -0,0 +1,225 @@
+"""
+Vectorized indicator functions that compute an indicator for every ticker at once.
+
+Each function takes a window of the price matrix as a 2D numpy array where the
+rows are trading days and the columns are tickers. Missing prices are NaN and
+are skipped the same way the per ticker methods in the backtester skip them
+with dropna(): only the valid prices of a column are used and they are
+renumbered 0..m-1 for the linear regression. Columns without enough valid
+prices get an indicator of 0 just like the per ticker methods. The functions also
+take an optional boolean array of which prices exist (such as the validity bitmap
+of a compact PriceStore) and work on float32 windows.
+
+PrefixSumKernel precomputes running sums over the whole price matrix once so the
+slope and mean deviation of any window can be found for every ticker in O(1).
+WindowKernel has the same methods but computes each window from a PriceStore
+without keeping the running sums, for price matrices too large to duplicate.
+"""
+
+import numpy as np
+
+
+def last_valid_prices(window, valid):
+    """Returns the last non-NaN price of each column as float64 (NaN if the column has none)."""
+    rows = window.shape[0]
+    last_idx = rows - 1 - np.argmax(valid[::-1], axis=0)
+    return window[last_idx, np.arange(window.shape[1])].astype(np.float64)
+
+
+def slope_indicator(window, valid=None):
+    """Slope of the least squares line through the valid prices divided by the last price."""
+    valid = ~np.isnan(window) if valid is None else valid
+    count = valid.sum(axis=0)
+    indicators = np.zeros(window.shape[1])
+    enough = count >= 2  # Not enough data points for a regression otherwise
+    if not enough.any():
+        return indicators
+
+    # Element wise work stays in the window's dtype (float32 for a compact store) and only the sums are float64
+    dtype = window.dtype
+    safe_count = np.maximum(count, 1)
+    x_mean = (count - 1) / 2.0
+    y_mean = np.where(valid, window, 0).sum(axis=0, dtype=np.float64) / safe_count
+    # x is the position of each price among the valid prices of its column, centered on its mean
+    centered_x = np.cumsum(valid, axis=0, dtype=dtype)
+    centered_x -= (x_mean + 1).astype(dtype)
+    # Centered sums keep the slope accurate for large prices
+    products = window - y_mean.astype(dtype)
+    products *= centered_x
+    products[~valid] = 0
+    covariance = products.sum(axis=0, dtype=np.float64)
+    variance = count * (count * count - 1) / 12.0
+    slopes = covariance[enough] / variance[enough]
+    indicators[enough] = slopes / last_valid_prices(window, valid)[enough]
+    return indicators
+
+
+def mean_deviation_indicator(window, valid=None):
+    """(Mean price - last price) / mean price of the valid prices of each column."""
+    valid = ~np.isnan(window) if valid is None else valid
+    count = valid.sum(axis=0)
+    indicators = np.zeros(window.shape[1])
+    has_data = count > 0
+    if not has_data.any():
+        return indicators
+
+    # Summed in float64 without copying a float32 window to float64 first
+    mean_prices = np.where(valid, window, 0).sum(axis=0, dtype=np.float64)[has_data] / count[has_data]
+    last_prices = last_valid_prices(window, valid)[has_data]
+    indicators[has_data] = (mean_prices - last_prices) / mean_prices
+    return indicators
+
+
+def median_deviation_indicator(window, valid=None):
+    """(Median price - last price) / median price of the valid prices of each column.
+    Missing prices must be NaN in the window because nanmedian skips them."""
+    valid = ~np.isnan(window) if valid is None else valid
+    has_data = valid.any(axis=0)
+    indicators = np.zeros(window.shape[1])
+    if not has_data.any():
+        return indicators
+
+    # nanmedian partitions each column instead of sorting it and works in the dtype of the window
+    columns = window if has_data.all() else window[:, has_data]
+    median_prices = np.nanmedian(columns, axis=0).astype(np.float64)
+    last_prices = last_valid_prices(window, valid)[has_data]
+    indicators[has_data] = (median_prices - last_prices) / median_prices
+    return indicators
+
+
+def combined_indicator(window, valid=None):
+    """Mean deviation plus linear regression slope over the same window."""
+    valid = ~np.isnan(window) if valid is None else valid
+    return mean_deviation_indicator(window, valid) + slope_indicator(window, valid)
+
+
+class PrefixSumKernel:
+    """Running sums over the price matrix used to answer window indicators in O(1) per ticker.
+
+    The least squares slope on x = 0..n-1 only needs n, the sum of y and the sum of x*y.
+    The sums restart every block_rows rows, and inside a block each price is shifted by a price
+    of its block and x counts the valid prices from the start of the block, so the sums stay
+    small however long the history is and short windows late in the data keep their precision.
+    A window is made of the parts of the blocks it covers, which are moved onto the same x and
+    shift before they are added up.
+    """
+
+    def __init__(self, prices, block_rows=1024):
+        valid = ~np.isnan(prices)
+        rows, columns = prices.shape
+        self.block_rows = block_rows
+        block_starts = range(0, rows, block_rows)
+
+        # Each block is shifted by the first valid price of the column in the block (carried over from the
+        # blocks before, or back from the first block with a price, when the block has none)
+        offsets = np.full((len(block_starts), columns), np.nan)
+        for block, start in enumerate(block_starts):
+            block_valid = valid[start:start + block_rows]
+            has_data = block_valid.any(axis=0)
+            first_idx = start + np.argmax(block_valid, axis=0)
+            offsets[block, has_data] = prices[first_idx[has_data], np.flatnonzero(has_data)]
+        has_offset = ~np.isnan(offsets)
+        carried = np.maximum.accumulate(np.where(has_offset, np.arange(len(offsets))[:, None], 0), axis=0)
+        offsets = offsets[carried, np.arange(columns)]
+        first_offsets = np.nan_to_num(offsets[np.argmax(has_offset, axis=0), np.arange(columns)])
+        self.offsets = np.where(np.isnan(offsets), first_offsets, offsets)
+
+        # Row i of each running sum covers the rows from the start of its block to i (inclusive)
+        self.counts = np.empty((rows, columns))
+        self.y_sums = np.empty((rows, columns))
+        self.xy_sums = np.empty((rows, columns))
+        for block, start in enumerate(block_starts):
+            rows_slice = slice(start, start + block_rows)
+            block_valid = valid[rows_slice]
+            y = np.where(block_valid, prices[rows_slice] - self.offsets[block], 0.0)
+            np.cumsum(block_valid, axis=0, out=self.counts[rows_slice])
+            x = self.counts[rows_slice] - 1.0  # Position of each price among the valid prices of its block
+            np.cumsum(y, axis=0, out=self.y_sums[rows_slice])
+            np.cumsum(np.where(block_valid, x * y, 0.0), axis=0, out=self.xy_sums[rows_slice])
+
+        # Last valid price at or before each row
+        last_idx = np.maximum.accumulate(np.where(valid, np.arange(rows)[:, None], 0), axis=0)
+        self.last_prices = prices[last_idx, np.arange(columns)]
+
+    def part_sums(self, start_idx, end_idx):
+        """Number of valid prices, sum of y and sum of x*y of rows start_idx to end_idx of one block, and the
+        number of valid prices of the block before start_idx"""
+        if start_idx % self.block_rows == 0:
+            return self.counts[end_idx], self.y_sums[end_idx], self.xy_sums[end_idx], 0.0
+        before = self.counts[start_idx - 1]
+        return (self.counts[end_idx] - before, self.y_sums[end_idx] - self.y_sums[start_idx - 1],
+                self.xy_sums[end_idx] - self.xy_sums[start_idx - 1], before)
+
+    def window_sums(self, start_idx, end_idx):
+        """Number of valid prices, sum of y and sum of x*y with x numbered from 0 inside the window and y shifted
+        by the offset of the window's last block, and that offset"""
+        offset = self.offsets[end_idx // self.block_rows]
+        count = y_sum = xy_sum = 0.0
+        part_start = start_idx
+        while part_start <= end_idx:
+            block = part_start // self.block_rows
+            part_end = min(end_idx, (block + 1) * self.block_rows - 1)
+            part_count, part_y, part_xy, before = self.part_sums(part_start, part_end)
+            shift = self.offsets[block] - offset
+            # x of the part moves from the block's numbering to the window's and y to the window's shift
+            xy_sum = xy_sum + part_xy + (count - before) * part_y + shift * (
+                part_count * count + part_count * (part_count - 1) / 2.0)
+            y_sum = y_sum + part_y + part_count * shift
+            count = count + part_count
+            part_start = part_end + 1
+        return count, y_sum, xy_sum, offset
+
+    def slope_indicator(self, start_idx, end_idx):
+        """Slope indicator of rows start_idx to end_idx (inclusive) for every ticker"""
+        count, y_sum, xy_sum, _ = self.window_sums(start_idx, end_idx)
+        indicators = np.zeros(count.shape)
+        enough = count >= 2  # Not enough data points for a regression otherwise
+        if not enough.any():
+            return indicators
+        count, y_sum, xy_sum = count[enough], y_sum[enough], xy_sum[enough]
+        covariance = xy_sum - (count - 1) / 2.0 * y_sum
+        variance = count * (count * count - 1) / 12.0
+        indicators[enough] = covariance / variance / self.last_prices[end_idx][enough]
+        return indicators
+
+    def mean_deviation_indicator(self, start_idx, end_idx):
+        """Mean deviation indicator of rows start_idx to end_idx (inclusive) for every ticker"""
+        count, y_sum, _, offset = self.window_sums(start_idx, end_idx)
+        indicators = np.zeros(count.shape)
+        has_data = count > 0
+        mean_prices = y_sum[has_data] / count[has_data] + offset[has_data]
+        last_prices = self.last_prices[end_idx][has_data]
+        indicators[has_data] = (mean_prices - last_prices) / mean_prices
+        return indicators
+
+    def combined_indicator(self, start_idx, end_idx):
+        """Mean deviation plus linear regression slope over the same window"""
+        return self.mean_deviation_indicator(start_idx, end_idx) + self.slope_indicator(start_idx, end_idx)
+
+
+class WindowKernel:
+    """Same interface as PrefixSumKernel but each window is computed from a PriceStore when it is asked for.
+
+    The running sums of PrefixSumKernel are four float64 arrays the size of the price matrix,
+    which is more memory than a compact store saves. This kernel only reads the rows of the window (a view of the
+    store) and uses the store's validity bitmap instead of scanning the window for NaN.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def slope_indicator(self, start_idx, end_idx):
+        """Slope indicator of rows start_idx to end_idx (inclusive) for every ticker"""
+        return slope_indicator(*self.store.window(start_idx, end_idx))
+
+    def mean_deviation_indicator(self, start_idx, end_idx):
+        """Mean deviation indicator of rows start_idx to end_idx (inclusive) for every ticker"""
+        return mean_deviation_indicator(*self.store.window(start_idx, end_idx))
+
+    def median_deviation_indicator(self, start_idx, end_idx):
+        """Median deviation indicator of rows start_idx to end_idx (inclusive) for every ticker"""
+        return median_deviation_indicator(*self.store.window(start_idx, end_idx))
+
+    def combined_indicator(self, start_idx, end_idx):
+        """Mean deviation plus linear regression slope over the same window"""
+        return combined_indicator(*self.store.window(start_idx, end_idx))
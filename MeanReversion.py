@@ -4,6 +4,8 @@ Parameters: tickers, start_date, end_date, amount (starting cash), and step_size
 """
 
 from Backtester import Backtester
+from DataSources import ConcurrentLoader, PriceCache
+from IndicatorStore import IndicatorStore
 
 
 def main():
@@ -23,16 +25,17 @@ def main():
     end_date = '2024-04-21'
     step_size = 60  # How often mean reversion is taken and stocks are bought and sold
     amount = 10000
-    backtester = Backtester(tickers, start_date, end_date, amount)
-    backtester.run_strategy(step_size, "mean reversion")
-    backtester.portfolio_value = 10000
-    backtester.run_strategy(step_size, "reverse mean reversion")
+    # Prices are cached in the price_cache folder so later runs do not download them again.
+    # Missing prices are downloaded in concurrent batches and tickers that fail are reported and skipped
+    source = PriceCache("price_cache", ConcurrentLoader())
+    # Indicators are saved in the indicator_cache folder so running this file again reuses them
+    backtester = Backtester(tickers, start_date, end_date, amount, data_source=source,
+                            indicator_store=IndicatorStore(cache_dir="indicator_cache"))
+    # Runs the strategy and its reverse together in one pass over the data
+    backtester.run_strategies(step_size, ["mean reversion", "reverse mean reversion"])
 
     step_size = 5
-    backtester.portfolio_value = 10000
-    backtester.run_strategy(step_size, "mean reversion")
-    backtester.portfolio_value = 10000
-    backtester.run_strategy(step_size, "reverse mean reversion")
+    backtester.run_strategies(step_size, ["mean reversion", "reverse mean reversion"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+"""
+Price storage for the backtester.
+
+The dense store keeps the price matrix as float64 with NaN for missing prices, which is
+what the backtester has always used. The compact store is for large universes and long
+histories: prices are kept as float32 (half the memory) and can be memory-mapped from a
+file so only the pages that are used are loaded. It also keeps a validity bitmap with
+one bit per price, so the indicators can tell which prices exist from 1/32 of the
+memory of the prices instead of scanning them for NaN. Missing prices are still stored
+as NaN so any code reading the prices directly keeps working.
+
+Windows are returned as views of the stored array, never as per ticker copies.
+"""
+
+import hashlib
+import os
+import tempfile
+import weakref
+import numpy as np
+import pandas as pd
+
+
+class PriceStore:
+    def __init__(self, values, valid_bits=None):
+        """values has trading days as rows and tickers as columns. valid_bits is the packed validity
+        bitmap (np.packbits along the tickers) or None to find missing prices from the NaNs."""
+        self.values = values
+        self.valid_bits = valid_bits
+        self.num_rows, self.num_columns = values.shape
+
+    @classmethod
+    def from_frame(cls, frame, compact=False, memmap_dir=None):
+        """Builds a dense float64 store, or a compact float32 store with a validity bitmap
+        (memory-mapped from a new file in memmap_dir if it is given, which is deleted once the prices are
+        not used anymore)"""
+        if not compact:
+            return cls(np.ascontiguousarray(frame.to_numpy(dtype=np.float64)))
+
+        if memmap_dir is None:
+            values = np.ascontiguousarray(frame.to_numpy(dtype=np.float32))
+        else:
+            os.makedirs(memmap_dir, exist_ok=True)
+            # Every store gets its own file so a new store never writes over the prices of a live one
+            file_descriptor, path = tempfile.mkstemp(suffix='.float32', prefix='prices_', dir=memmap_dir)
+            os.close(file_descriptor)
+            values = np.memmap(path, dtype=np.float32, mode='r+', shape=frame.shape)
+            # Copies one block of rows at a time so the float32 copy is never all in memory at once
+            for start in range(0, len(frame), 4096):
+                values[start:start + 4096] = frame.iloc[start:start + 4096].to_numpy(dtype=np.float32)
+            values.flush()
+            values = np.memmap(path, dtype=np.float32, mode='r', shape=frame.shape)
+            # Frames and windows of the prices keep the map alive, so the file goes when the last of them does
+            weakref.finalize(values, os.unlink, path)
+        valid_bits = np.empty((len(frame), (frame.shape[1] + 7) // 8), dtype=np.uint8)
+        for start in range(0, len(frame), 4096):
+            valid_bits[start:start + 4096] = np.packbits(~np.isnan(values[start:start + 4096]), axis=1)
+        return cls(values, valid_bits)
+
+    @property
+    def compact(self):
+        return self.valid_bits is not None
+
+    @property
+    def nbytes(self):
+        """Bytes used by the prices and the bitmap"""
+        return self.values.nbytes + (self.valid_bits.nbytes if self.compact else 0)
+
+    def version(self, index, columns):
+        """Hash of the prices, dates and tickers that changes whenever the data does"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(self.values.dtype).encode())
+        # Hashed one block of rows at a time so memory-mapped prices are not read into memory at once
+        for start in range(0, self.num_rows, 4096):
+            digest.update(np.ascontiguousarray(self.values[start:start + 4096]).data)
+        digest.update(np.asarray(index, dtype='datetime64[ns]').view(np.int64).tobytes())
+        digest.update("\0".join(str(column) for column in columns).encode())
+        return digest.hexdigest()
+
+    def to_frame(self, index, columns):
+        """DataFrame that shares the stored prices instead of copying them"""
+        return pd.DataFrame(self.values, index=index, columns=columns, copy=False)
+
+    def window(self, start_idx, end_idx):
+        """Prices of rows start_idx to end_idx (inclusive) as a view and a boolean array of which exist"""
+        values = self.values[start_idx:end_idx + 1]
+        if not self.compact:
+            return values, ~np.isnan(values)
+        valid = np.unpackbits(self.valid_bits[start_idx:end_idx + 1], axis=1, count=self.num_columns)
+        return values, valid.view(bool)
+
+    def column(self, column, start_idx, end_idx):
+        """Existing prices of one ticker column from row start_idx to end_idx as float64"""
+        prices = self.values[start_idx:end_idx + 1, column]
+        return np.asarray(prices[~np.isnan(prices)], dtype=np.float64)
+
+    def row(self, row_idx, columns):
+        """Prices of the given columns on one row as float64 (NaN if missing)"""
+        return np.asarray(self.values[row_idx, columns], dtype=np.float64)
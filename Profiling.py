@@ -0,0 +1,90 @@
+"""
+Instrumentation for backtest runs.
+
+A RunProfiler is created for every run of the backtester. It adds up the time spent in
+each phase of the backtest loop (indicators, allocation, returns, orders, recording,
+printing and plotting) and counts how often each indicator function is called, so a slow
+run shows where its time goes without an external profiler. It can also run cProfile
+and tracemalloc over the whole run. The summary is attached to the BacktestResults of
+the run as results.timings.
+"""
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class RunProfiler:
+    def __init__(self, profile=False, trace_memory=False):
+        """profile=True runs cProfile over the run and trace_memory=True records its peak memory with tracemalloc"""
+        self.seconds = defaultdict(float)  # Time spent in each phase
+        self.calls = defaultdict(int)  # Number of times each phase ran
+        self.indicator_calls = defaultdict(int)  # Calls of each indicator function
+        self.cache_hits = 0  # Indicators reused from the cache instead of computed
+        self.cache_misses = 0  # Indicators computed and added to the cache
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.started_tracing = False
+        self.peak_memory_mb = None
+        self.start_time = None
+        self.total_seconds = None
+
+    def start(self):
+        """Starts the run clock and the optional profilers"""
+        if self.trace_memory:
+            # An outer tracemalloc session (such as the benchmark's) is left running
+            self.started_tracing = not tracemalloc.is_tracing()
+            if self.started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.profiler is not None:
+            self.profiler.enable()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        """Stops the run clock and the optional profilers"""
+        self.total_seconds = time.perf_counter() - self.start_time
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            self.peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1e6
+            if self.started_tracing:
+                tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the time spent inside the with block to the phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def count_indicator(self, name, calls=1):
+        """Counts calls of an indicator function"""
+        self.indicator_calls[name] += calls
+
+    def profile_text(self, top=20):
+        """The top functions by cumulative time from cProfile (None if profiling was off)"""
+        if self.profiler is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(top)
+        return output.getvalue()
+
+    def summary(self):
+        """Dictionary with the total time, the time and calls of each phase and the indicator call counts"""
+        return {
+            'total_seconds': self.total_seconds,
+            'phases': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+            'indicator_calls': dict(self.indicator_calls),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'peak_memory_mb': self.peak_memory_mb,
+            'profile': self.profile_text()
+        }
@@ -0,0 +1,168 @@
+"""
+Results of a backtest run.
+
+run_strategy returns a BacktestResults object instead of only printing and plotting so
+many runs can be collected and compared without a terminal or a plot window. It holds
+the value history of the portfolio, the per step returns and a ledger of every trade
+stored as columns (one numpy array per field). The results can be exported to CSV or
+Parquet and plotted to the screen or to an image file without opening a window. The time spent
+in each phase of the run is kept in timings.
+"""
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def plot_value_history(value_history, title, path=None):
+    """Plots the value of the portfolio over time. Shows the plot or saves it to path
+    with the non-interactive Agg backend if a path is given."""
+    plot_value_histories([(None, value_history)], title, path)
+
+
+def plot_comparison(results, path=None):
+    """Plots the value histories of several runs on the same axes with a legend"""
+    first = results[0]
+    title = (f"{len(results)} Strategies: {first.start_date.date()} to {first.end_date.date()}, "
+             f"Step Size: {first.step_size}")
+    plot_value_histories([(result.strategy.title(), result.value_history) for result in results], title, path)
+
+
+def plot_value_histories(labelled_histories, title, path=None):
+    """Plots (label, value history) pairs and shows the plot or saves it to path"""
+    if path is None:
+        import matplotlib.pyplot as plt  # Only needed to show an interactive window
+        figure = plt.figure(figsize=(10, 5))
+    else:
+        figure = Figure(figsize=(10, 5))
+        FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    for label, value_history in labelled_histories:
+        dates, values = zip(*value_history)
+        axes.plot(dates, values, 'o-', label=label)
+    if len(labelled_histories) > 1:
+        axes.legend()
+    axes.set_title(title)
+    axes.set_xlabel("Date")
+    axes.set_ylabel("Portfolio Value ($)")
+    axes.grid(True)
+    if path is None:
+        plt.show()
+    else:
+        figure.savefig(path)
+
+
+def print_trades(label, start_time, end_time, investments, step_return):
+    """Prints the trades executed in one step and the return of the step"""
+    # Daily bars are printed as dates and intraday bars with their time
+    start_time, end_time = [time.date() if time == time.normalize() else time for time in (start_time, end_time)]
+    print(f"\n{label} {start_time} to {end_time}:")
+    print("Trades executed:")
+    for trade_type, orders in investments.items():
+        print(f"{trade_type.capitalize()}:")
+        for ticker, amount in orders.items():
+            print(f"  {ticker}: ${amount:.2f}")
+    print(f"Return after this period: ${step_return:.2f}")
+
+
+class BacktestResults:
+    def __init__(self, strategy, step_size, start_date, end_date, amount):
+        self.strategy = strategy
+        self.step_size = step_size
+        self.start_date = start_date
+        self.end_date = end_date
+        self.amount = amount  # Starting money
+        self.busted = False  # True if the run stopped because the portfolio value hit zero
+        self.timings = None  # Phase timings and indicator call counts of the run (see Profiling.py)
+        self.accounting = None  # Per step pnl, turnover and costs of vectorized runs (see Accounting.py)
+        # Value history and ledger are appended to during the run and turned into arrays by finish()
+        self.dates = []
+        self.values = []
+        self.ledger = {'step': [], 'start_date': [], 'end_date': [], 'ticker': [], 'side': [], 'amount': []}
+        self.step_returns = None
+
+    def add_value(self, date, value):
+        """Records the portfolio value at the end of a step"""
+        self.dates.append(date)
+        self.values.append(value)
+
+    def add_trades(self, step, start_time, end_time, investments):
+        """Records the buy and short orders placed at the start of a step"""
+        for side, orders in investments.items():
+            for ticker, amount in orders.items():
+                self.ledger['step'].append(step)
+                self.ledger['start_date'].append(start_time)
+                self.ledger['end_date'].append(end_time)
+                self.ledger['ticker'].append(ticker)
+                self.ledger['side'].append(side)
+                self.ledger['amount'].append(amount)
+
+    def finish(self):
+        """Turns the recorded lists into numpy arrays and calculates the return of every step"""
+        self.dates = pd.DatetimeIndex(self.dates)
+        self.values = np.asarray(self.values, dtype=np.float64)
+        self.ledger = {
+            'step': np.asarray(self.ledger['step'], dtype=np.int64),
+            'start_date': pd.DatetimeIndex(self.ledger['start_date']).to_numpy(),
+            'end_date': pd.DatetimeIndex(self.ledger['end_date']).to_numpy(),
+            'ticker': np.asarray(self.ledger['ticker'], dtype=object),
+            'side': np.asarray(self.ledger['side'], dtype=object),
+            'amount': np.asarray(self.ledger['amount'], dtype=np.float64)
+        }
+        self.step_returns = self.values[1:] / self.values[:-1] - 1
+        return self
+
+    @property
+    def value_history(self):
+        """List of (date, portfolio value) pairs"""
+        return list(zip(self.dates, self.values))
+
+    @property
+    def final_value(self):
+        return self.values[-1]
+
+    @property
+    def total_return(self):
+        return self.values[-1] / self.amount - 1
+
+    @property
+    def max_drawdown(self):
+        """Largest drop from a previous peak as a fraction of that peak"""
+        peaks = np.maximum.accumulate(self.values)
+        return float(np.max((peaks - self.values) / peaks))
+
+    def title(self):
+        """Title used for the plot"""
+        return (f"{self.strategy.title()} Strategy: {self.start_date.date()} to {self.end_date.date()}, "
+                f"Step Size: {self.step_size}")
+
+    def values_frame(self):
+        """DataFrame of the portfolio value and the return of the step ending on each date"""
+        step_returns = np.concatenate(([np.nan], self.step_returns))
+        return pd.DataFrame({'value': self.values, 'step_return': step_returns},
+                            index=pd.Index(self.dates, name='date'))
+
+    def ledger_frame(self):
+        """DataFrame with one row per trade"""
+        return pd.DataFrame(self.ledger)
+
+    def timings_frame(self):
+        """DataFrame with the time, calls and share of the run time of each phase, slowest first"""
+        frame = pd.DataFrame.from_dict(self.timings['phases'], orient='index', columns=['seconds', 'calls'])
+        frame['share'] = frame['seconds'] / self.timings['total_seconds']
+        return frame.rename_axis('phase').sort_values('seconds', ascending=False)
+
+    def to_csv(self, prefix):
+        """Writes the values to prefix_values.csv and the trades to prefix_trades.csv"""
+        self.values_frame().to_csv(f"{prefix}_values.csv")
+        self.ledger_frame().to_csv(f"{prefix}_trades.csv", index=False)
+
+    def to_parquet(self, prefix):
+        """Writes the values to prefix_values.parquet and the trades to prefix_trades.parquet"""
+        self.values_frame().to_parquet(f"{prefix}_values.parquet")
+        self.ledger_frame().to_parquet(f"{prefix}_trades.parquet", index=False)
+
+    def plot(self, path=None):
+        """Shows the plot of the value history or saves it to path"""
+        plot_value_history(self.value_history, self.title(), path)
@@ -0,0 +1,112 @@
+"""
+Rolling median with two heaps for use in the median reversion algorithm.
+The lower half of the window is kept in a max heap and the upper half in a min heap
+so the median is always at the top of the heaps. Prices that leave the window are
+removed lazily: they are remembered in a dictionary and only popped once they reach
+the top of a heap. Once the heaps hold more than twice the prices of the window they are
+rebuilt from the window, so removed prices deep in the heaps do not pile up over a long
+history. Insert and evict are O(log n) amortized and the median is O(1), so moving the
+window forward only costs the prices that enter and leave it instead of rebuilding a
+BST from scratch. Unlike the BST there is no recursion and no O(n^2) worst case for
+trending prices.
+"""
+
+import heapq
+from collections import deque
+
+
+class RollingMedian:
+    def __init__(self):
+        self.low = []  # Max heap of the lower half stored as negative values
+        self.high = []  # Min heap of the upper half
+        self.low_size = 0  # Number of prices in each half not waiting to be removed
+        self.high_size = 0
+        self.delayed = {}  # Prices waiting to be removed from the heaps and their counts
+        self.window = deque()  # (key, price) pairs in the order they were inserted
+        # Bounds of the window that the prices were taken from
+        self.start = None
+        self.end = None
+
+    def __len__(self):
+        return len(self.window)
+
+    def clear(self):
+        """Removes every price from the window"""
+        self.__init__()
+
+    def prune(self, heap, sign):
+        """Pops prices at the top of the heap that are waiting to be removed"""
+        while heap and sign * heap[0] in self.delayed:
+            price = sign * heapq.heappop(heap)
+            self.delayed[price] -= 1
+            if self.delayed[price] == 0:
+                del self.delayed[price]
+
+    def rebalance(self):
+        """Keeps the lower half the same size or one bigger than the upper half"""
+        if self.low_size > self.high_size + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self.prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.high_size -= 1
+            self.low_size += 1
+            self.prune(self.high, 1)
+
+    def insert(self, key, price):
+        """Adds a price to the window, key is used to evict it later (e.g. its date)"""
+        self.window.append((key, price))
+        if not self.low or price <= -self.low[0]:
+            heapq.heappush(self.low, -price)
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, price)
+            self.high_size += 1
+        self.rebalance()
+
+    def evict(self):
+        """Removes the oldest price from the window and returns its (key, price)"""
+        key, price = self.window.popleft()
+        self.delayed[price] = self.delayed.get(price, 0) + 1
+        if price <= -self.low[0]:
+            self.low_size -= 1
+            if price == -self.low[0]:
+                self.prune(self.low, -1)
+        else:
+            self.high_size -= 1
+            if price == self.high[0]:
+                self.prune(self.high, 1)
+        self.rebalance()
+        if len(self.low) + len(self.high) > 2 * len(self.window) + 8:
+            self.rebuild()
+        return key, price
+
+    def rebuild(self):
+        """Rebuilds both heaps from the prices in the window, dropping every price waiting to be removed"""
+        prices = sorted(price for _, price in self.window)
+        self.low_size = (len(prices) + 1) // 2  # Lower half is the same size or one bigger
+        self.high_size = len(prices) - self.low_size
+        self.low = [-price for price in prices[:self.low_size]]
+        self.high = prices[self.low_size:]
+        heapq.heapify(self.low)
+        heapq.heapify(self.high)
+        self.delayed = {}
+
+    def evict_before(self, key):
+        """Removes every price inserted with a key smaller than key"""
+        while self.window and self.window[0][0] < key:
+            self.evict()
+
+    def last_price(self):
+        """Most recently inserted price still in the window"""
+        return self.window[-1][1] if self.window else None
+
+    def median(self):
+        """Median of the prices in the window (None if the window is empty)"""
+        if not self.window:
+            return None
+        if self.low_size > self.high_size:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2.0
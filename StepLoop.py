@@ -0,0 +1,91 @@
+"""
+Step loop shared by the Backtester and the StreamingBacktester.
+
+Both testers run several strategies in one pass over the steps of a run. They only differ
+in where the prices of a step come from (the whole price matrix or the buffer of streamed
+bars), so the parts of a step that do not depend on that live here: trading every active
+strategy with the tester's perform_step, recording and printing the trades, stopping
+strategies whose portfolio is worth nothing, calling on_step, and finishing, printing,
+plotting and timing the results at the end of the run.
+"""
+
+import time
+from Results import BacktestResults, plot_comparison, print_trades
+
+
+def weights_to_orders(tickers, indicators, buy_weights, short_weights, selected, portfolio_value):
+    """Turns weight vectors into dictionaries of dollar amounts in order of decreasing indicator magnitude"""
+    buy_orders = {}
+    short_orders = {}
+    for i in selected:
+        if indicators[i] > 0:
+            buy_orders[tickers[i]] = portfolio_value * buy_weights[i]
+        else:
+            short_orders[tickers[i]] = portfolio_value * short_weights[i]
+    return buy_orders, short_orders
+
+
+def start_results(strategies, step_size, run_start, run_end, first_time, amount):
+    """BacktestResults of every strategy by name with the starting value recorded at first_time"""
+    results = {}
+    for strategy in strategies:
+        results[strategy.name] = BacktestResults(strategy.name, step_size, run_start, run_end, amount)
+        results[strategy.name].add_value(first_time, amount)
+    return results
+
+
+def trade_step(tester, step, start_idx, end_idx, start_time, end_time, strategies, active, indicators, values,
+               results, verbosity, record_trades=True):
+    """Trades the step from row start_idx to end_idx for every active strategy with tester.perform_step using
+    the indicators of the previous step. Updates values and results and removes busted strategies from active."""
+    profiler = tester.profiler
+    for strategy in list(active):
+        name = strategy.name
+        current_value, investments = tester.perform_step(start_idx, end_idx, indicators[name], values[name])
+
+        # Records and prints all trades and their returns for the most recent time step
+        if record_trades:
+            with profiler.phase('recording'):
+                results[name].add_trades(step, start_time, end_time, investments)
+        if verbosity >= 2:
+            with profiler.phase('printing'):
+                label = f"{name.title()} from" if len(strategies) > 1 else "From"
+                print_trades(label, start_time, end_time, investments, current_value - values[name])
+
+        values[name] = current_value  # updates portfolio value
+        results[name].add_value(end_time, current_value)  # updates value history for graphing later
+        if current_value <= 0:
+            if verbosity >= 1:
+                print(f"{name.title()}: Portfolio value zero or negative")
+            results[name].busted = True
+            active.remove(strategy)  # Stops this strategy so the others can continue
+
+
+def report_step(on_step, step, start_time, end_time, values, active, step_start, profiler):
+    """Calls on_step (if it is given) with the step's dates, portfolio values and time"""
+    if on_step is not None:
+        on_step({'step': step, 'start_date': start_time, 'end_date': end_time, 'values': dict(values),
+                 'active': [strategy.name for strategy in active],
+                 'seconds': time.perf_counter() - step_start, 'profiler': profiler})
+
+
+def finish_results(results, profiler, verbosity, plot):
+    """Finishes the results of a run, prints their summary, plots them and attaches the run's timings"""
+    for result in results.values():
+        result.finish()
+        if verbosity >= 1:
+            print(f"\n{result.title()}: final value ${result.final_value:.2f} "
+                  f"({result.total_return:.2%} return)")
+    # When at the end of trading days plot results
+    if plot and results:
+        with profiler.phase('plotting'):
+            path = None if plot is True else plot
+            if len(results) == 1:
+                next(iter(results.values())).plot(path)
+            else:
+                plot_comparison(list(results.values()), path)
+    profiler.stop()
+    timings = profiler.summary()
+    for result in results.values():
+        result.timings = timings  # Strategies of one pass share the same timings
+    return results
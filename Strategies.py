@@ -0,0 +1,121 @@
+"""
+Registry of the trading strategies that the backtester can run.
+
+Each strategy declares how its indicators are calculated instead of the backtester
+dispatching on the strategy name:
+- indicator: batched function (backtester, start_idx, end_idx) returning an array with the
+  indicator of every ticker column for the rows start_idx to end_idx
+- ticker_indicator: function (backtester, ticker, start_idx, end_idx) returning the indicator
+  of one ticker, used when run_strategy is called with batched=False
+- lookback: rows the indicator looks at for a step ending at end_idx. None uses the rows of
+  the step, an int uses that many rows and a pd.Timedelta uses that much calendar time
+- reverse: the indicators are multiplied by -1 so the strategy buys what it would sell
+- key and version: stable name of the indicator and the version of its code. Indicators are only
+  saved to disk by an IndicatorStore for strategies with a key, and the version must be raised
+  whenever the indicator functions change so old saved indicators are not reused. Strategies
+  without a key share indicators in memory only, by indicator function
+
+New strategies are added with register_strategy and run by name with run_strategy.
+"""
+
+import pandas as pd
+import Indicators
+
+
+class Strategy:
+    def __init__(self, name, indicator, ticker_indicator, lookback=None, reverse=False, key=None, version=1):
+        self.name = name
+        self.indicator = indicator
+        self.ticker_indicator = ticker_indicator
+        self.lookback = lookback
+        self.reverse = reverse
+        self.key = key
+        self.version = version
+
+    @property
+    def multiplier(self):
+        """Multiplier applied to the indicators: -1 reverses the strategy"""
+        return -1 if self.reverse else 1
+
+    @property
+    def indicator_key(self):
+        """Identifies the indicators so a strategy and its reverse can share them. Without a key the function
+        objects are used so different functions with the same name (such as lambdas) never share indicators."""
+        if self.key is None:
+            return (self.indicator, self.ticker_indicator, self.lookback)
+        return (self.key, self.version, self.lookback)
+
+    def reversed(self):
+        """Same strategy with the sign of its indicators switched"""
+        name = self.name[len("reverse "):] if self.reverse else f"reverse {self.name}"
+        return Strategy(name, self.indicator, self.ticker_indicator, self.lookback, not self.reverse, self.key,
+                        self.version)
+
+    def with_lookback(self, lookback):
+        """Same strategy with another lookback (such as minutes instead of days for intraday bars)"""
+        return Strategy(self.name, self.indicator, self.ticker_indicator, lookback, self.reverse, self.key,
+                        self.version)
+
+
+# Strategies by name
+STRATEGIES = {}
+
+
+def register_strategy(strategy, with_reverse=True):
+    """Adds a strategy (and its reverse unless with_reverse is False) to the registry"""
+    STRATEGIES[strategy.name] = strategy
+    if with_reverse:
+        reverse = strategy.reversed()
+        STRATEGIES[reverse.name] = reverse
+    return strategy
+
+
+def get_strategy(strategy):
+    """Returns the registered strategy with the given name (Strategy objects are returned as they are)"""
+    if isinstance(strategy, Strategy):
+        return strategy
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Invalid strategy: {strategy}")
+    return STRATEGIES[strategy]
+
+
+def slope(backtester, start_idx, end_idx):
+    return backtester.kernel.slope_indicator(start_idx, end_idx)
+
+
+def mean_deviation(backtester, start_idx, end_idx):
+    return backtester.kernel.mean_deviation_indicator(start_idx, end_idx)
+
+
+def median_deviation(backtester, start_idx, end_idx):
+    return Indicators.median_deviation_indicator(*backtester.store.window(start_idx, end_idx))
+
+
+def combined(backtester, start_idx, end_idx):
+    return backtester.kernel.combined_indicator(start_idx, end_idx)
+
+
+def ticker_slope(backtester, ticker, start_idx, end_idx):
+    return backtester.linear_regression_indicator(ticker, start_idx, end_idx)
+
+
+def ticker_mean_deviation(backtester, ticker, start_idx, end_idx):
+    return backtester.mean_deviation_indicator(ticker, start_idx, end_idx)
+
+
+def ticker_median_deviation(backtester, ticker, start_idx, end_idx):
+    return backtester.median_deviation_indicator(ticker, start_idx, end_idx)
+
+
+def ticker_combined(backtester, ticker, start_idx, end_idx):
+    return backtester.combined_indicator(ticker, start_idx, end_idx)
+
+
+# Combined strategy only looks at the last five calendar days of each step
+COMBINED_LOOKBACK = pd.Timedelta(days=5)
+
+register_strategy(Strategy("linear regression", slope, ticker_slope, key="slope"))
+register_strategy(Strategy("mean reversion", mean_deviation, ticker_mean_deviation, key="mean deviation"))
+register_strategy(Strategy("median reversion", median_deviation, ticker_median_deviation, key="median deviation"))
+register_strategy(Strategy("short and long term", combined, ticker_combined, lookback=COMBINED_LOOKBACK,
+                           key="combined"))
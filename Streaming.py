@@ -0,0 +1,230 @@
+"""
+Streaming backtester for intraday and other bar data that does not fit in memory.
+
+read_bar_chunks reads a CSV or Parquet bar file in time ordered chunks and turns each
+chunk into a frame of closing prices with the bar times as rows and the tickers as
+columns, the same layout the Backtester uses for daily prices. The file can be long
+(one row per bar with time, ticker and close columns) or wide (one row per bar time
+and one column per ticker). Rows with the same bar time are never split between chunks.
+
+StreamingBacktester runs the registered strategies over the chunks with their batched
+indicators. It only holds the rows of the current step and the lookback each strategy
+needs for its next step, so memory depends on the step size, the lookbacks and the chunk
+size instead of the length of the history. Steps are counted in bars like the Backtester
+counts trading days, and calendar lookbacks such as COMBINED_LOOKBACK can be replaced with
+intraday ones through Strategy.with_lookback. The trading, recording and finishing of each
+step are shared with the Backtester (StepLoop.py), so runs have the same timings and on_step.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from Allocation import TIE_BREAKS, allocate_weights
+import Indicators
+from PriceStore import PriceStore
+from Profiling import RunProfiler
+from StepLoop import finish_results, report_step, start_results, trade_step, weights_to_orders
+from Strategies import get_strategy
+
+
+def raw_chunks(path, chunk_rows):
+    """Yields the rows of a CSV or Parquet file as DataFrames of at most chunk_rows rows"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq  # Only needed for Parquet files
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def read_bar_chunks(path, tickers, chunk_rows=1000000, time_column='timestamp', ticker_column='ticker',
+                    price_column='close'):
+    """Yields frames of closing prices (bar times as rows and tickers as columns) from a bar file sorted by time.
+    Long files have time_column, ticker_column and price_column. Wide files have time_column (or the time
+    in the first column) and one column per ticker."""
+    carry = None  # Rows of the last bar time of the previous chunk
+    last_time = None
+    for chunk in raw_chunks(path, chunk_rows):
+        long_format = ticker_column in chunk.columns
+        if not long_format:
+            time_key = time_column if time_column in chunk.columns else chunk.columns[0]
+            prices = chunk.set_index(time_key)
+            prices.index = pd.to_datetime(prices.index)
+            prices = prices.reindex(columns=tickers)
+        else:
+            if carry is not None:
+                chunk = pd.concat((carry, chunk))
+            times = pd.to_datetime(chunk[time_column])
+            # The last bar time may continue in the next chunk so its rows are held back
+            complete = times < times.iloc[-1]
+            carry = chunk[~complete.to_numpy()]
+            chunk, times = chunk[complete.to_numpy()], times[complete]
+            if len(chunk) == 0:
+                continue
+            prices = pd.DataFrame({'time': times.to_numpy(), 'ticker': chunk[ticker_column].to_numpy(),
+                                   'close': chunk[price_column].to_numpy()})
+            prices = prices.pivot(index='time', columns='ticker', values='close').reindex(columns=tickers)
+        if last_time is not None and prices.index[0] <= last_time:
+            raise ValueError(f"Bars are not sorted by time at {prices.index[0]}")
+        if not prices.index.is_monotonic_increasing:
+            raise ValueError("Bars are not sorted by time")
+        last_time = prices.index[-1]
+        yield prices.dropna(how='all')  # Drops bar times without any of the tickers like get_stock_data
+
+    if carry is not None and len(carry) > 0:
+        prices = pd.DataFrame({'time': pd.to_datetime(carry[time_column]).to_numpy(),
+                               'ticker': carry[ticker_column].to_numpy(), 'close': carry[price_column].to_numpy()})
+        yield prices.pivot(index='time', columns='ticker', values='close').reindex(columns=tickers).dropna(how='all')
+
+
+class StreamingBacktester:
+    def __init__(self, tickers, amount, path, chunk_rows=1000000, verbosity=1, selection_fraction=0.1,
+                 max_positions=None, tie_break='first', storage='dense', **read_options):
+        """path is a bar file read with read_bar_chunks (read_options are passed on to it). The other
+        parameters are the same as the Backtester's."""
+        self.tickers = list(tickers)  # Column order of the price buffer
+        self.amount = amount  # Starting money
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.read_options = read_options
+        self.verbosity = verbosity
+        self.selection_fraction = selection_fraction
+        if max_positions is not None and max_positions < 1:
+            raise ValueError(f"Invalid max_positions: {max_positions}")
+        self.max_positions = max_positions
+        if tie_break not in TIE_BREAKS:
+            raise ValueError(f"Invalid tie_break: {tie_break}")
+        self.tie_break = tie_break
+        if storage not in ('dense', 'compact'):
+            raise ValueError(f"Invalid storage: {storage}")
+        self.storage = storage
+        self.max_buffer_rows = 0  # Largest number of bars held at once during the last run
+        self.profiler = RunProfiler()  # Timings of the most recent run
+        self.reset_buffer()
+
+    def chunks(self):
+        """Reads the bar file from the start"""
+        return read_bar_chunks(self.path, self.tickers, self.chunk_rows, **self.read_options)
+
+    def reset_buffer(self):
+        """Empties the buffer of bars"""
+        self.times = pd.DatetimeIndex([])
+        self.prices = np.empty((0, len(self.tickers)))
+        self.store = self.kernel = None  # Built when the first chunk arrives
+
+    def set_prices(self, prices):
+        """Stores the buffered prices and builds the kernel the batched indicators read from"""
+        self.store = PriceStore.from_frame(pd.DataFrame(prices), self.storage == 'compact')
+        self.prices = self.store.values
+        if self.store.compact:
+            self.kernel = Indicators.WindowKernel(self.store)
+        else:
+            self.kernel = Indicators.PrefixSumKernel(self.prices)
+
+    def append_chunk(self, chunk, keep_from):
+        """Adds the bars of a chunk to the buffer and drops the bars before row keep_from"""
+        self.times = self.times[keep_from:].append(chunk.index)
+        self.set_prices(np.concatenate((self.prices[keep_from:], chunk.to_numpy(dtype=np.float64))))
+        self.max_buffer_rows = max(self.max_buffer_rows, len(self.times))
+
+    def lookback_start(self, lookback, start_row, end_row):
+        """First buffer row of a strategy's lookback for the step from start_row to end_row"""
+        if lookback is None:
+            return start_row  # Uses the rows of the step
+        if isinstance(lookback, (int, np.integer)):
+            return max(0, end_row - lookback + 1)
+        return self.times.searchsorted(self.times[end_row] - lookback)
+
+    def retain_start(self, lookback, end_row):
+        """First buffer row that the lookback of the step after the one ending at end_row can need"""
+        if lookback is None:
+            return end_row + 1
+        if isinstance(lookback, (int, np.integer)):
+            return max(0, end_row - lookback + 2)  # The next step ends at least one row later
+        return self.times.searchsorted(self.times[end_row] - lookback)
+
+    def perform_step(self, start_row, end_row, indicators, portfolio_value):
+        """Allocates funds from the previous step's indicators and returns the new portfolio value and the orders"""
+        with self.profiler.phase('allocation'):
+            buy_weights, short_weights, selected = allocate_weights(indicators, self.selection_fraction,
+                                                                    self.max_positions, self.tie_break)
+        with self.profiler.phase('returns'):
+            ratios = self.store.row(end_row, selected) / self.store.row(start_row, selected)
+            gain = np.dot(buy_weights[selected], ratios - 1) + np.dot(short_weights[selected], 1 - ratios)
+        with self.profiler.phase('orders'):
+            buy_orders, short_orders = weights_to_orders(self.tickers, indicators, buy_weights, short_weights,
+                                                         selected, portfolio_value)
+        return portfolio_value + portfolio_value * gain, {'buy': buy_orders, 'short': short_orders}
+
+    def run_strategy(self, step_size, strategy, verbosity=None, plot=True, record_trades=True, profile=False,
+                     trace_memory=False, on_step=None):
+        """Streams the bars through one strategy and returns its BacktestResults"""
+        strategy = get_strategy(strategy)
+        return self.run_strategies(step_size, [strategy], verbosity, plot, record_trades, profile, trace_memory,
+                                   on_step)[strategy.name]
+
+    def run_strategies(self, step_size, strategies, verbosity=None, plot=True, record_trades=True, profile=False,
+                       trace_memory=False, on_step=None):
+        """Streams the bars once through several strategies and returns a dictionary of BacktestResults by
+        strategy name. step_size is in bars. record_trades=False skips the trade ledger, which can be much
+        larger than the value history for long intraday runs. The other arguments are the same as the
+        Backtester's run_strategies."""
+        strategies = [get_strategy(strategy) for strategy in strategies]
+        verbosity = self.verbosity if verbosity is None else verbosity
+        self.profiler = RunProfiler(profile, trace_memory)
+        profiler = self.profiler
+        profiler.start()
+        self.reset_buffer()
+        self.max_buffer_rows = 0
+        values = {strategy.name: self.amount for strategy in strategies}
+        indicators = {}
+        results = {}
+        active = list(strategies)  # Strategies whose portfolio value is still positive
+        start_row = 0  # Buffer row where the current step starts
+        keep_from = 0  # Bars before this buffer row are not needed anymore
+        step = 0
+
+        def run_step(start_row, end_row):
+            """Trades the step from start_row to end_row and calculates the indicators for the next step"""
+            nonlocal step, results
+            step_start = time.perf_counter()
+            start_time, end_time = self.times[start_row], self.times[end_row]
+            if not results:
+                results = start_results(strategies, step_size, start_time, None, start_time, self.amount)
+            else:  # No trades are placed on first step because there is no prior data
+                step += 1
+                trade_step(self, step, start_row, end_row, start_time, end_time, strategies, active, indicators,
+                           values, results, verbosity, record_trades)
+
+            # Indicators are shared within the step by strategies that use the same indicator and window
+            step_cache = {}
+            with profiler.phase('indicators'):
+                for strategy in active:
+                    if strategy.indicator_key not in step_cache:
+                        window_start = self.lookback_start(strategy.lookback, start_row, end_row)
+                        step_cache[strategy.indicator_key] = strategy.indicator(self, window_start, end_row)
+                        profiler.count_indicator(strategy.indicator.__name__)
+                    indicators[strategy.name] = strategy.multiplier * step_cache[strategy.indicator_key]
+            report_step(on_step, step, start_time, end_time, values, active, step_start, profiler)
+            # Only the bars the next step's lookbacks can reach are kept
+            return min([end_row + 1] + [self.retain_start(strategy.lookback, end_row) for strategy in active])
+
+        for chunk in self.chunks():
+            if len(chunk) == 0:
+                continue
+            with profiler.phase('buffering'):
+                self.append_chunk(chunk, keep_from)
+            start_row -= keep_from  # Row positions move back by the number of dropped bars
+            keep_from = 0
+            # Runs every step whose last bar has arrived
+            while start_row + step_size < len(self.times) and active:
+                keep_from = run_step(start_row, start_row + step_size)
+                start_row += step_size + 1
+        if start_row < len(self.times) and active:
+            run_step(start_row, len(self.times) - 1)  # Last step is cut short by the end of the data
+
+        for result in results.values():
+            result.end_date = self.times[-1]
+        if verbosity >= 1:
+            print(f"Most bars held in memory: {self.max_buffer_rows}")
+        return finish_results(results, profiler, verbosity, plot)
@@ -0,0 +1,102 @@
+"""
+Parameter sweep runner that backtests many (strategy, reverse, step size, date window)
+configurations in parallel.
+
+The price data is loaded once and shared read-only with a pool of worker processes.
+Every configuration gets its own Backtester built from the shared prices, so runs do not
+share portfolio values or indicators and nothing has to be reset between runs.
+The results are returned as a pandas DataFrame with one row per configuration.
+Parameters: tickers, start_date, end_date, amount, strategies, step_sizes and windows can be modified in main().
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from Backtester import Backtester
+from DataSources import PriceCache
+
+# Price data and starting amount shared with every worker process
+shared_data = None
+shared_amount = None
+
+
+def init_worker(data, amount):
+    """Stores the shared price data in each worker process"""
+    global shared_data, shared_amount
+    shared_data = data
+    shared_amount = amount
+
+
+def run_configuration(config):
+    """Runs every strategy of one (step size, date window) configuration in a single pass over the shared
+    price data and returns the rows of the results table"""
+    strategies, step_size, window_start, window_end = config
+    data = shared_data
+    if window_start is not None or window_end is not None:
+        data = data.loc[window_start:window_end]
+    backtester = Backtester(list(data.columns), data.index[0], data.index[-1], shared_amount, data=data,
+                            verbosity=0)
+    names = [f"reverse {strategy}" if reverse else strategy for strategy, reverse in strategies]
+    results = backtester.run_strategies(step_size, names, plot=False)
+    rows = []
+    for (strategy, reverse), name in zip(strategies, names):
+        rows.append({
+            'strategy': strategy,
+            'reverse': reverse,
+            'step_size': step_size,
+            'start_date': data.index[0],
+            'end_date': data.index[-1],
+            'final_value': results[name].final_value,
+            'total_return': results[name].total_return,
+            'max_drawdown': results[name].max_drawdown,
+            'num_steps': len(results[name].step_returns)
+        })
+    return rows
+
+
+def run_sweep(data, amount, strategies, step_sizes, reverse_flags=(False, True), windows=None, processes=None):
+    """Backtests every combination of strategy, reverse flag, step size and (start, end) date window
+    on the price data in parallel and returns a DataFrame with one row per run.
+    All strategies with the same step size and window are run together in one pass over the data."""
+    windows = windows if windows is not None else [(None, None)]
+    strategy_pairs = list(itertools.product(strategies, reverse_flags))
+    configs = [(strategy_pairs, step_size, start, end) for step_size, (start, end)
+               in itertools.product(step_sizes, windows)]
+    processes = processes if processes is not None else os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(data, amount)) as pool:
+        # Larger chunks cut down on inter process communication for big sweeps
+        chunksize = max(1, len(configs) // (4 * processes))
+        rows = [row for config_rows in pool.map(run_configuration, configs, chunksize=chunksize)
+                for row in config_rows]
+    return pd.DataFrame(rows)
+
+
+def main():
+    """Sweeps all 4 strategies and their reverses over 10 step sizes"""
+    tickers = [
+        'AAPL', 'MSFT', 'GOOGL', 'T', 'VZ', 'AMZN', 'META', 'TSLA', 'NVDA', 'INTC', 'AMD',
+        'IBM', 'CSCO', 'ORCL', 'ADBE', 'CRM', 'NFLX', 'DIS', 'PFE', 'JNJ', 'GILD', 'NKE',
+        'KO', 'PEP', 'MCD', 'WMT', 'TGT', 'COST', 'CVX', 'XOM', 'BP', 'T', 'VZ',
+        'TMUS', 'BA', 'LMT', 'NOC', 'BABA', 'JD', 'V', 'MA', 'JPM', 'GS', 'BAC', 'C',
+        'WFC', 'BLK', 'AXP', 'GE', 'GM', 'F', 'DAL', 'UAL', 'AAL', 'LUV', 'EA', 'TTWO', 'SPG',
+        'AMT', 'PLD', 'CCI', 'D', 'SO', 'XEL', 'NEE', 'GSK', 'CVS', 'WBA', 'TMO', 'ABT', 'LHX',
+        'GD', 'TXT', 'HON', 'UNH', 'MCK', 'MO', 'PM', 'STZ', 'BTI', 'CL', 'PG', 'UL', 'EL',
+        'ADM', 'ADP', 'BIIB', 'BLK', 'CAH', 'CAT', 'COP', 'DD', 'ECL', 'F', 'PFE', 'SLB', 'TXN', 'V',
+        'RTX', 'SPGI', 'LOW', 'GS', 'ISRG', 'HON', 'AXP', 'INTC', 'INTU', 'BMY', 'IBM', 'QCOM', 'GE', 'DE'
+    ]
+    start_date = '2014-10-01'
+    end_date = '2024-04-21'
+    amount = 10000
+    strategies = ["linear regression", "mean reversion", "median reversion", "short and long term"]
+    step_sizes = [5, 10, 15, 20, 30, 40, 60, 90, 120, 250]
+
+    # Loads the prices once for every run of the sweep
+    data = Backtester(tickers, start_date, end_date, amount, data_source=PriceCache("price_cache")).data
+    results = run_sweep(data, amount, strategies, step_sizes)
+    print(results.sort_values('total_return', ascending=False).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
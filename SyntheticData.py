@@ -0,0 +1,30 @@
+"""
+Synthetic price generator so the backtester can be run and benchmarked offline.
+
+Prices follow a geometric random walk for each ticker on business days. A fraction of
+the prices (nan_density) is replaced by NaN to imitate missing data, and some tickers
+start trading later than others like newly listed stocks in real data.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def generate_prices(num_tickers, num_days, nan_density=0.0, start_date='2014-10-01', seed=0):
+    """Returns a DataFrame of synthetic closing prices with trading days as rows and tickers as columns"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start_date, periods=num_days)
+    tickers = [f"T{i:05d}" for i in range(num_tickers)]
+
+    daily_returns = rng.normal(0.0003, 0.02, size=(num_days, num_tickers))
+    start_prices = rng.uniform(10, 500, size=num_tickers)
+    prices = start_prices * np.exp(np.cumsum(daily_returns, axis=0))
+
+    if nan_density > 0:
+        prices[rng.random(prices.shape) < nan_density] = np.nan
+        # About 5% of the tickers only start trading part way through the history
+        late_starters = rng.random(num_tickers) < 0.05
+        listing_days = rng.integers(0, num_days // 2, size=num_tickers)
+        for column in np.flatnonzero(late_starters):
+            prices[:listing_days[column], column] = np.nan
+    return pd.DataFrame(prices, index=dates, columns=tickers)
@@ -0,0 +1,118 @@
+"""
+Tests of the ConcurrentLoader against a local stand-in for yfinance.
+
+The prices are synthetic (SyntheticData.py) and written to one CSV file per ticker so the
+loader reads them through a LocalFileSource. StandIn wraps that source and can make
+chosen tickers raise, come back without prices or hang, the way yfinance downloads fail.
+Run with: python -m pytest test_DataSources.py
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from DataSources import ConcurrentLoader, DataSource, LocalFileSource
+from SyntheticData import generate_prices
+
+
+class StandIn(DataSource):
+    def __init__(self, source, failing=(), empty_once=(), raise_once=(), hanging=()):
+        """Tickers in failing always raise, tickers in empty_once and raise_once come back without prices or
+        raise the first time they are asked for, and batches with a ticker in hanging wait until released"""
+        self.source = source
+        self.failing = set(failing)
+        self.empty_once = set(empty_once)
+        self.raise_once = set(raise_once)
+        self.hanging = set(hanging)
+        self.release = threading.Event()
+        self.calls = []  # Tickers of every call
+        self.lock = threading.Lock()
+
+    def get_prices(self, tickers, start_date, end_date):
+        with self.lock:
+            self.calls.append(list(tickers))
+            raise_now = self.raise_once & set(tickers)
+            self.raise_once -= raise_now
+            empty_now = self.empty_once & set(tickers)
+            self.empty_once -= empty_now
+        if self.hanging & set(tickers):
+            self.release.wait(10)
+        if self.failing & set(tickers) or raise_now:
+            raise ConnectionError("symbol down")
+        prices = self.source.get_prices(tickers, start_date, end_date)
+        for ticker in empty_now:
+            prices[ticker] = np.nan  # yfinance returns a failed download as an empty column
+        return prices
+
+
+@pytest.fixture
+def prices():
+    return generate_prices(12, 60, seed=1)
+
+
+@pytest.fixture
+def source(prices, tmp_path):
+    for ticker in prices.columns:
+        prices[[ticker]].rename(columns={ticker: 'Close'}).to_csv(tmp_path / f"{ticker}.csv")
+    return LocalFileSource(str(tmp_path))
+
+
+def fetch(loader, prices, tickers):
+    return loader.fetch(tickers, prices.index[0], prices.index[-1] + pd.Timedelta(days=1))
+
+
+def test_loads_every_ticker(prices, source):
+    loaded, failures = fetch(ConcurrentLoader(source, batch_size=5), prices, list(prices.columns))
+    assert failures == {}
+    pd.testing.assert_frame_equal(loaded, prices, check_freq=False)
+
+
+def test_duplicate_ticker_is_fetched_once(prices, source):
+    stand_in = StandIn(source)
+    tickers = ['T00001', 'T00002', 'T00001']
+    loaded, failures = fetch(ConcurrentLoader(stand_in, batch_size=5), prices, tickers)
+    assert list(loaded.columns) == ['T00001', 'T00002']
+    assert failures == {}
+    assert stand_in.calls == [['T00001', 'T00002']]
+
+
+def test_unknown_ticker_is_reported_as_no_data(prices, source):
+    loader = ConcurrentLoader(StandIn(source), batch_size=5, retries=1, backoff=0)
+    loaded, failures = fetch(loader, prices, ['T00000', 'NOPE', 'T00003'])
+    assert list(loaded.columns) == ['T00000', 'T00003']
+    assert failures == {'NOPE': "no data"}
+
+
+def test_raising_batch_is_retried(prices, source):
+    stand_in = StandIn(source, raise_once=['T00004'])
+    loaded, failures = fetch(ConcurrentLoader(stand_in, batch_size=5, backoff=0), prices, list(prices.columns))
+    assert failures == {}
+    assert list(loaded.columns) == list(prices.columns)
+    assert sum('T00004' in call for call in stand_in.calls) == 2
+
+
+def test_empty_ticker_is_retried(prices, source):
+    stand_in = StandIn(source, empty_once=['T00006'])
+    loaded, failures = fetch(ConcurrentLoader(stand_in, batch_size=5, backoff=0), prices, list(prices.columns))
+    assert failures == {}
+    assert loaded['T00006'].notna().all()
+    assert ['T00006'] in stand_in.calls  # Only the empty ticker is asked for again
+
+
+def test_failing_ticker_does_not_fail_its_batch(prices, source):
+    stand_in = StandIn(source, failing=['T00007'])
+    loader = ConcurrentLoader(stand_in, batch_size=5, retries=2, backoff=0)
+    loaded, failures = fetch(loader, prices, list(prices.columns))
+    assert failures == {'T00007': "ConnectionError: symbol down"}
+    assert list(loaded.columns) == [ticker for ticker in prices.columns if ticker != 'T00007']
+
+
+def test_timed_out_batch_is_reported(prices, source):
+    stand_in = StandIn(source, hanging=['T00010'])
+    loader = ConcurrentLoader(stand_in, batch_size=5, timeout=0.5)
+    try:
+        loaded, failures = fetch(loader, prices, list(prices.columns))
+    finally:
+        stand_in.release.set()
+    assert failures == {ticker: "timed out" for ticker in ['T00010', 'T00011']}
+    assert list(loaded.columns) == list(prices.columns[:10])